@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Compare pickling Features with packed coordinates against pickling
+their __dict__ as they are, on their own and as IPC to and from the
+workers of a multiprocessing.Pool. Run from the top of the source tree:
+
+    PYTHONPATH=. python bench/bench_pickle.py
+"""
+
+import cPickle, random, time, timeit
+from multiprocessing import Pool
+
+from simplegeo.shared import Feature
+
+N = 1000
+
+class PlainFeature(Feature):
+    """ A Feature which pickles the way Features used to. """
+    def __getstate__(self):
+        return self.__dict__
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+def make_jsonstrs(vertices):
+    r = random.Random(0)
+    jsonstrs = []
+    for i in xrange(N):
+        lat, lon = r.uniform(-60, 60), r.uniform(-170, 170)
+        if vertices == 1:
+            geometry = '{"type": "Point", "coordinates": [%.6f, %.6f]}' % (lon, lat)
+        else:
+            ring = ['[%.6f, %.6f]' % (lon + r.uniform(0, 0.1), lat + r.uniform(0, 0.1)) for j in range(vertices - 1)]
+            ring.append(ring[0])
+            geometry = '{"type": "Polygon", "coordinates": [[%s]]}' % (', '.join(ring),)
+        jsonstrs.append('{"geometry": %s, "type": "Feature", "id": null, "properties": {"name": "place %d"}}' % (geometry, i))
+    return jsonstrs
+
+def make_features(cls, jsonstrs, decimal_to_float):
+    return [cls.from_json(s, decimal_to_float=decimal_to_float) for s in jsonstrs]
+
+def roundtrip(feature):
+    return feature
+
+def bench_pool(pool, features, chunksize=50):
+    start = time.time()
+    pool.map(roundtrip, features, chunksize)
+    return time.time() - start
+
+def main():
+    pool = Pool(2)
+    try:
+        print "%d features each, pickle protocol 2; pool times are a round trip through 2 workers" % (N,)
+        print "%-36s %10s %12s %12s %14s" % ("", "bytes/feat", "dumps ms", "loads ms", "pool feats/s")
+        for vertices in (1, 20, 200):
+            jsonstrs = make_jsonstrs(vertices)
+            for decimal_to_float in (False, True):
+                for cls in (PlainFeature, Feature):
+                    features = make_features(cls, jsonstrs, decimal_to_float)
+                    pickled = cPickle.dumps(features, 2)
+                    dumps = min(timeit.repeat(lambda: cPickle.dumps(features, 2), number=1, repeat=3))
+                    loads = min(timeit.repeat(lambda: cPickle.loads(pickled), number=1, repeat=3))
+                    elapsed = min([bench_pool(pool, features) for i in range(5)])
+                    name = "%s, %d vertices, %s" % (cls is Feature and "packed" or "plain", vertices, decimal_to_float and "float" or "Decimal")
+                    print "%-36s %10d %12.1f %12.1f %14.0f" % (name, len(pickled) / N, dumps * 1000, loads * 1000, N / elapsed)
+    finally:
+        pool.close()
+        pool.join()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Compare the batch and memoized validators with the original per-value
+ones. Run from the top of the source tree:
+
+    PYTHONPATH=. python bench/bench_validators.py
+"""
+
+import array, random, timeit
+
+import ipaddr
+
+from simplegeo.shared import is_numeric, is_valid_lon, are_valid_lats, are_valid_lons, are_valid_ips
+
+N = 100000
+
+def original_is_valid_ip(ip):
+    try:
+        ipaddr.IPAddress(ip)
+    except ValueError:
+        return False
+    else:
+        return True
+
+def original_is_valid_lat(x):
+    return is_numeric(x) and (x <= 90) and (x >= -90)
+
+def make_ips():
+    r = random.Random(0)
+    # Request logs see the same addresses over and over.
+    pool = ['%d.%d.%d.%d' % (r.randrange(256), r.randrange(256), r.randrange(256), r.randrange(256)) for i in range(1000)]
+    pool += ['2001:db8::%x' % i for i in range(50)] + ['not an ip', '999.1.1.1']
+    return [r.choice(pool) for i in xrange(N)]
+
+def make_coords():
+    r = random.Random(0)
+    return [r.uniform(-100, 100) for i in xrange(N)]
+
+def bench(name, func, number=5):
+    best = min(timeit.repeat(func, number=1, repeat=number))
+    print "%-45s %8.1f ms  (%6.0f ns/value)" % (name, best * 1000, best * 1e9 / N)
+    return best
+
+def main():
+    ips = make_ips()
+    coords = make_coords()
+    coordarray = array.array('d', coords)
+
+    assert are_valid_ips(ips) == [original_is_valid_ip(ip) for ip in ips]
+    assert are_valid_lats(coords) == [original_is_valid_lat(x) for x in coords]
+
+    print "%d values each" % (N,)
+    base = bench("original is_valid_ip() loop", lambda: [original_is_valid_ip(ip) for ip in ips])
+    new = bench("are_valid_ips()", lambda: are_valid_ips(ips))
+    print "  speedup: %.1fx" % (base / new,)
+
+    base = bench("original is_valid_lat() loop", lambda: [original_is_valid_lat(x) for x in coords])
+    new = bench("are_valid_lats(list)", lambda: are_valid_lats(coords))
+    print "  speedup: %.1fx" % (base / new,)
+    new = bench("are_valid_lats(array.array('d'))", lambda: are_valid_lats(coordarray))
+    print "  speedup: %.1fx" % (base / new,)
+
+    base = bench("is_valid_lon() loop", lambda: [is_valid_lon(x) for x in coords])
+    new = bench("are_valid_lons(list)", lambda: are_valid_lons(coords))
+    print "  speedup: %.1fx" % (base / new,)
+
+if __name__ == '__main__':
+    main()
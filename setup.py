@@ -55,6 +55,9 @@ setup(name=PKG,
       keywords="simplegeo",
       zip_safe=False, # actually it is zip safe, but zipping packages doesn't help with anything and can cause some problems (http://bugs.python.org/setuptools/issue33 )
       namespace_packages = ['simplegeo'],
+      entry_points = {
+          'console_scripts': ['simplegeo-geojson = simplegeo.shared.geojsontool:main'],
+          },
       test_suite='simplegeo.shared.test',
       setup_requires=setup_requires,
       tests_require=tests_require)
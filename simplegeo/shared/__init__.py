@@ -1,11 +1,47 @@
 from _version import __version__
+from limiter import AIMDLimiter, is_overload_status
+from hedging import HedgePolicy
+from cache import FeatureCache
+from prefetch import Prefetcher
+from recordindex import RecordIndex, content_json, hash_content_json
+from connections import DNSCache, CachedDNSConnection, is_connection_alive
+from balancer import HostPool
+from breaker import CircuitBreaker
+import spatialkeys
+from spatialkeys import normalize_lon, SpatialKeyIndex, sort_by_spatial_key, partition_by_spatial_key
+
+# The public names of this package, including those re-exported from
+# its submodules.
+__all__ = [
+    '__version__', 'API_VERSION',
+    'Feature', 'Client', 'APIError', 'DecodeError', 'CircuitOpenError',
+    'is_unavailable_error', 'ERROR_BODY_LIMIT', 'truncate_body', 'json_decode',
+    'swap', 'deep_swap', 'deep_swap_reduce', 'deep_validate_lat_lon', 'deep_leaves',
+    'SIMPLIFIABLE_GEOMTYPES', 'MAX_PRECISION', 'make_quantizer', 'simplify_line',
+    'PACK_MIN_NUMBERS', 'pack_coordinates', 'unpack_coordinates',
+    'SIMPLEGEOHANDLE_RSTR', 'SIMPLEGEOHANDLE_R', 'is_simplegeohandle', 'FEATURES_URL_R',
+    'is_numeric', 'is_valid_lat', 'is_valid_lon', 'are_valid_lats', 'are_valid_lons',
+    'IPV4_R', 'IP_CACHE_SIZE', 'is_valid_ip', 'are_valid_ips',
+    'to_unicode', 'to_utf8', 'NON_ASCII_R',
+    'AIMDLimiter', 'is_overload_status',
+    'DNSCache', 'CachedDNSConnection', 'is_connection_alive',
+    'HostPool',
+    'normalize_lon',
+    'HedgePolicy',
+    'FeatureCache', 'Prefetcher',
+    'RecordIndex',
+    'SpatialKeyIndex', 'sort_by_spatial_key', 'partition_by_spatial_key',
+    'CircuitBreaker',
+    ]
 
 API_VERSION = '1.0'
 
-import copy, re
-from decimal import Decimal as D
+import array, copy, os, re, sys, threading, time, Queue
+from decimal import Decimal as D, InvalidOperation
+from itertools import chain
 
-from httplib2 import Http
+import httplib
+from httplib2 import Http, HttpLib2Error, urlnorm
 import oauth2 as oauth
 
 import ipaddr
@@ -17,7 +53,39 @@ from pyutil.assertutil import precondition, _assert
 
 # example: http://api.simplegeo.com/1.0/feature/abcdefghijklmnopqrstuvwyz.json
 
+# At most this many characters of a response body are kept in an
+# APIError or DecodeError. None means keep all of it.
+ERROR_BODY_LIMIT = 4096
+
+try:
+    _BUFFER_TYPES = (buffer, bytearray, memoryview)
+except NameError:
+    # Python 2.6 has no memoryview.
+    _BUFFER_TYPES = (buffer, bytearray)
+
+def truncate_body(body, limit=None):
+    """
+    Return the first limit characters of body (by default
+    ERROR_BODY_LIMIT), copying only that prefix.
+    """
+    if limit is None:
+        limit = ERROR_BODY_LIMIT
+    if limit is None or not hasattr(body, '__len__') or len(body) <= limit:
+        return body
+    return body[:limit]
+
 def json_decode(jsonstr):
+    """
+    jsonstr may be a str, a unicode, or a buffer, bytearray or
+    memoryview holding utf-8 encoded JSON. A str is handed to the
+    JSON decoder as is; the buffer types are turned into a str
+    exactly once first.
+    """
+    if isinstance(jsonstr, _BUFFER_TYPES):
+        if hasattr(jsonstr, 'tobytes'):
+            jsonstr = jsonstr.tobytes()
+        else:
+            jsonstr = str(jsonstr)
     try:
         return json.loads(jsonstr)
     except (ValueError, TypeError), le:
@@ -33,6 +101,127 @@ def deep_swap(struc):
         return swap(struc)
     return [deep_swap(sub) for sub in struc]
 
+# Geometry types whose innermost coordinate sequences are lines (or
+# rings) and can therefore be simplified. Compared case-insensitively
+# because "Multipolygon" is sometimes spelled that way.
+SIMPLIFIABLE_GEOMTYPES = frozenset(['linestring', 'multilinestring', 'polygon', 'multipolygon'])
+
+# Quantizing a Decimal coordinate (at most 3 integer digits) to more
+# decimal places than this exceeds the 28 digits of the default
+# decimal context.
+MAX_PRECISION = 25
+
+def make_quantizer(precision=None, decimal_to_float=False):
+    """
+    Return a function which rounds a single coordinate to precision
+    decimal places (or leaves it alone if precision is None), and
+    which, if decimal_to_float is True, turns Decimals into floats.
+
+    A Decimal too big to round to precision places (which can't be a
+    valid lat or lon) is left as it is, for the validation which
+    follows to reject.
+    """
+    if precision is not None:
+        if not isinstance(precision, (int, long)) or precision < 0:
+            raise TypeError("precision is required to be None or a non-negative integer, but it was: %r :: %s" % (precision, type(precision)))
+        if precision > MAX_PRECISION:
+            raise TypeError("precision is required to be at most %d, but it was: %r" % (MAX_PRECISION, precision))
+        exp = D(10) ** -precision
+    def quantize(x):
+        if isinstance(x, D):
+            if precision is not None:
+                try:
+                    x = x.quantize(exp)
+                except InvalidOperation:
+                    pass
+            if decimal_to_float:
+                x = float(x)
+        elif isinstance(x, float) and precision is not None:
+            x = round(x, precision)
+        return x
+    return quantize
+
+def _seg_dist2(fpoints, i, first, last):
+    """ The square of the distance from fpoints[i] to the segment from
+    fpoints[first] to fpoints[last]. """
+    ax, ay = fpoints[first]
+    dx = fpoints[last][0] - ax
+    dy = fpoints[last][1] - ay
+    px, py = fpoints[i]
+    seglen2 = dx*dx + dy*dy
+    if seglen2:
+        t = ((px-ax)*dx + (py-ay)*dy) / seglen2
+        t = min(1.0, max(0.0, t))
+        px, py = px - (ax + t*dx), py - (ay + t*dy)
+    else:
+        px, py = px - ax, py - ay
+    return px*px + py*py
+
+def _farthest(fpoints, first, last, candidates):
+    """ Return (square of the distance, index) of the point of
+    candidates farthest from the segment from first to last. """
+    maxd2 = -1.0
+    index = None
+    for i in candidates:
+        d2 = _seg_dist2(fpoints, i, first, last)
+        if d2 > maxd2:
+            maxd2 = d2
+            index = i
+    return maxd2, index
+
+def simplify_line(points, tolerance):
+    """
+    Simplify a sequence of (lat, lon) pairs with the Douglas-Peucker
+    algorithm, dropping every point which lies within tolerance
+    degrees of the line through the points that are kept. The first
+    and last points are always kept, so a closed ring (one whose
+    first and last points are equal) stays closed. A ring is never
+    simplified to fewer than four points: if it would be, then the
+    point farthest from the first one and the point farthest from the
+    two sides that makes are kept too.
+
+    Returns a new list containing a subset of the original points.
+    """
+    n = len(points)
+    if n < 3 or not tolerance:
+        return list(points)
+    fpoints = [(float(p[0]), float(p[1])) for p in points]
+    tol2 = float(tolerance) ** 2
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n-1)]
+    while stack:
+        first, last = stack.pop()
+        maxd2, index = _farthest(fpoints, first, last, xrange(first+1, last))
+        if index is not None and maxd2 > tol2:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    if n >= 4 and points[0] == points[-1] and keep.count(True) < 4:
+        far = _farthest(fpoints, 0, 0, xrange(1, n-1))[1]
+        keep[far] = True
+        nextfar = max(_farthest(fpoints, 0, far, xrange(1, far)),
+                      _farthest(fpoints, far, n-1, xrange(far+1, n-1)))[1]
+        keep[nextfar] = True
+    return [p for (p, k) in zip(points, keep) if k]
+
+def deep_swap_reduce(struc, quantize, tolerance=None):
+    """
+    Like deep_swap(), but also passes every coordinate through
+    quantize (see make_quantizer()) and, if tolerance is given,
+    simplifies every innermost line with simplify_line(). This is done
+    in a single pass so that a full-resolution swapped copy of the
+    geometry is never built.
+    """
+    if is_numeric(struc[0]):
+        _assert (len(struc) == 2, (type(struc), repr(struc)))
+        _assert (is_numeric(struc[1]), (type(struc), repr(struc)))
+        return (quantize(struc[1]), quantize(struc[0]))
+    if tolerance and is_numeric(struc[0][0]):
+        return simplify_line([deep_swap_reduce(sub, quantize) for sub in struc], tolerance)
+    return [deep_swap_reduce(sub, quantize, tolerance) for sub in struc]
+
 def deep_validate_lat_lon(struc, strict_lon_validation=False):
     """
     For the meaning of strict_lon_validation, please see the function
@@ -51,6 +240,114 @@ def deep_validate_lat_lon(struc, strict_lon_validation=False):
             deep_validate_lat_lon(sub, strict_lon_validation=strict_lon_validation)
     return True
 
+def deep_leaves(struc):
+    """ Yield every leaf (lat, lon) pair of struc. """
+    if is_numeric(struc[0]):
+        yield struc
+    else:
+        for sub in struc:
+            for leaf in deep_leaves(sub):
+                yield leaf
+
+class _Unpackable(Exception):
+    pass
+
+# The array.array typecode for the coordinates of each number type
+# which pack_coordinates() packs with array; Decimals are packed as
+# text so that they come back exactly.
+_PACK_TYPECODES = {float: 'd', int: 'l'}
+
+# cPickle handles floats and ints quickly, so with fewer numbers than
+# this packing them costs more time than it saves. Decimals pickle
+# slowly and are always worth packing.
+PACK_MIN_NUMBERS = 200
+
+def _pack_shape(struc, leaftype, values):
+    if type(struc) is not list or not struc:
+        raise _Unpackable()
+    if type(struc[0]) is leaftype and type(struc[0][0]) in _NUMERIC_TYPES:
+        if set(map(type, struc)) != set([leaftype]) or set(map(len, struc)) != set([2]):
+            raise _Unpackable()
+        values.extend(chain.from_iterable(struc))
+        return len(struc)
+    return [_pack_shape(sub, leaftype, values) for sub in struc]
+
+def _count_leaves(struc):
+    if type(struc[0][0]) in _NUMERIC_TYPES:
+        return len(struc)
+    return sum(map(_count_leaves, struc))
+
+def pack_coordinates(coordinates, min_numbers=0):
+    """
+    Return a compact form of coordinates, which pickles faster and
+    smaller than nested lists of numbers do, or None if coordinates
+    can't be packed. unpack_coordinates() turns it back into
+    coordinates equal to the original ones, with the same types.
+
+    coordinates can be packed if it is a single (lat, lon) or nested
+    lists of them (as Feature.from_dict() makes), all of its leaves
+    are tuples or all are lists, and all of its numbers are floats,
+    all are ints or all are Decimals. Floats and ints are only
+    packed if there are at least min_numbers of them.
+    """
+    values = []
+    try:
+        leaf = coordinates
+        while type(leaf[0]) not in _NUMERIC_TYPES:
+            leaf = leaf[0]
+        leaftype = type(leaf)
+        if leaftype not in (tuple, list):
+            return None
+        if leaf is coordinates:
+            if len(coordinates) != 2:
+                return None
+            values.extend(coordinates)
+            shape = None
+        else:
+            if min_numbers and type(leaf[0]) is not D and 2 * _count_leaves(coordinates) < min_numbers:
+                return None
+            shape = _pack_shape(coordinates, leaftype, values)
+    except (_Unpackable, TypeError, IndexError):
+        return None
+    numtypes = set(map(type, values))
+    if len(numtypes) != 1:
+        return None
+    numtype = numtypes.pop()
+    if numtype is D:
+        typecode = 'D'
+        data = ','.join(map(str, values))
+    elif numtype in _PACK_TYPECODES:
+        if len(values) < min_numbers:
+            return None
+        typecode = _PACK_TYPECODES[numtype]
+        data = array.array(typecode, values).tostring()
+    else:
+        return None
+    return (typecode, leaftype is tuple, shape, data)
+
+def unpack_coordinates(packed):
+    """ The inverse of pack_coordinates(). """
+    typecode, tupleleaves, shape, data = packed
+    if typecode == 'D':
+        values = map(D, data.split(','))
+    else:
+        a = array.array(typecode)
+        a.fromstring(data)
+        values = a.tolist()
+    if shape is None:
+        return tupleleaves and tuple(values) or values
+    leaves = zip(values[0::2], values[1::2])
+    if not tupleleaves:
+        leaves = map(list, leaves)
+    pos = [0]
+    def build(shape):
+        if isinstance(shape, int):
+            start = pos[0]
+            pos[0] += shape
+            return leaves[start:pos[0]]
+        return [build(sub) for sub in shape]
+    return build(shape)
+
 SIMPLEGEOHANDLE_RSTR=r"""SG_[A-Za-z0-9]{22}(?:_-?[0-9]{1,3}(?:\.[0-9]+)?_-?[0-9]{1,3}(?:\.[0-9]+)?)?(?:@[0-9]+)?$"""
 SIMPLEGEOHANDLE_R= re.compile(SIMPLEGEOHANDLE_RSTR)
 def is_simplegeohandle(s):
@@ -61,6 +358,39 @@ FEATURES_URL_R=re.compile("http://(.*)/features/([A-Za-z_,-]*).json$")
 def is_numeric(x):
     return isinstance(x, (int, long, float, D))
 
+# The exact types for which is_numeric() is True; checking these first
+# is cheaper than isinstance() against a tuple.
+_NUMERIC_TYPES = frozenset([int, long, float, D, bool])
+
+# array.array typecodes which hold numbers.
+_NUMERIC_TYPECODES = frozenset('bBhHiIlLfd')
+
+def _range_mask(xs, lo, hi):
+    if isinstance(xs, array.array) and xs.typecode in _NUMERIC_TYPECODES:
+        return [lo <= x <= hi for x in xs]
+    numeric_types = _NUMERIC_TYPES
+    return [(type(x) in numeric_types or is_numeric(x)) and lo <= x <= hi for x in xs]
+
+def are_valid_lats(xs):
+    """
+    Return a list of bools saying whether each element of xs (any
+    iterable, including an array.array) is a valid lat, the same as
+    calling is_valid_lat() on each of them, only faster.
+    """
+    return _range_mask(xs, -90, 90)
+
+def are_valid_lons(xs, strict=False):
+    """
+    Return a list of bools saying whether each element of xs (any
+    iterable, including an array.array) is a valid lon, the same as
+    calling is_valid_lon() on each of them, only faster. For the
+    meaning of strict, please see the function is_valid_lon().
+    """
+    if strict:
+        return _range_mask(xs, -180, 180)
+    else:
+        return _range_mask(xs, -360, 360)
+
 def is_valid_lat(x):
     return is_numeric(x) and (x <= 90) and (x >= -90)
 
@@ -105,6 +435,21 @@ def to_unicode(s):
             raise TypeError('You are required to pass either a unicode object or a utf-8 string here. You passed a Python string object which contained non-utf-8: %r. The UnicodeDecodeError that resulted from attempting to interpret it as utf-8 was: %s' % (s, le,))
     return s
 
+NON_ASCII_R = re.compile('[\x80-\xff]')
+def to_utf8(s):
+    """ Convert to a utf-8 encoded string, raise exception with
+    instructive error message if s is not unicode, ascii, or
+    utf-8. An ascii string, such as the output of json.dumps(), is
+    returned as is without being copied. """
+    if isinstance(s, unicode):
+        return s.encode('utf-8')
+    if not isinstance(s, str):
+        raise TypeError('You are required to pass either unicode or string here, not: %r (%s)' % (type(s), s))
+    if NON_ASCII_R.search(s):
+        # Raises an instructive TypeError if s isn't utf-8.
+        to_unicode(s)
+    return s
+
 class Feature:
     def __init__(self, coordinates, geomtype='Point', simplegeohandle=None, properties=None, strict_lon_validation=False):
         """
@@ -175,14 +520,30 @@ class Feature:
             self.properties.update(properties)
 
     @classmethod
-    def from_dict(cls, data, strict_lon_validation=False):
+    def from_dict(cls, data, strict_lon_validation=False, simplify_tolerance=None, precision=None, decimal_to_float=False):
         """
         data is a GeoJSON standard data structure, including that the
         coordinates are in GeoJSON order (lon, lat) instead of
         SimpleGeo order (lat, lon)
+
+        The geometry can optionally be reduced while it is being
+        decoded. If simplify_tolerance is given then every line or
+        ring of a LineString, MultiLineString, Polygon or MultiPolygon
+        is simplified with simplify_line(), dropping points which lie
+        within that many degrees of the simplified shape. If precision
+        is given then every coordinate is rounded to that many decimal
+        places. If decimal_to_float is True then Decimal coordinates
+        are converted to floats.
         """
         assert isinstance(data, dict), (type(data), repr(data))
-        coordinates = deep_swap(data['geometry']['coordinates'])
+        geometry = data['geometry']
+        if simplify_tolerance or precision is not None or decimal_to_float:
+            if geometry['type'].lower() not in SIMPLIFIABLE_GEOMTYPES:
+                simplify_tolerance = None
+            quantize = make_quantizer(precision, decimal_to_float)
+            coordinates = deep_swap_reduce(geometry['coordinates'], quantize, simplify_tolerance)
+        else:
+            coordinates = deep_swap(geometry['coordinates'])
         try:
             deep_validate_lat_lon(coordinates, strict_lon_validation=strict_lon_validation)
         except TypeError, le:
@@ -190,7 +551,7 @@ class Feature:
         feature = cls(
             simplegeohandle = data.get('id'),
             coordinates = coordinates,
-            geomtype = data['geometry']['type'],
+            geomtype = geometry['type'],
             properties = data.get('properties')
             )
 
@@ -213,21 +574,126 @@ class Feature:
         }
 
     @classmethod
-    def from_json(cls, jsonstr):
-        return cls.from_dict(json_decode(jsonstr))
+    def from_json(cls, jsonstr, **kwargs):
+        """
+        Keyword arguments are passed on to from_dict().
+        """
+        return cls.from_dict(json_decode(jsonstr), **kwargs)
 
     def to_json(self):
         return json.dumps(self.to_dict())
 
+    def __getstate__(self):
+        # Pickle the coordinates packed (see pack_coordinates()), which
+        # makes passing Features between processes, e.g. to and from
+        # the workers of a multiprocessing.Pool, much cheaper. Points
+        # and small geometries of floats are too small for it to pay.
+        if type(self.coordinates[0]) in _NUMERIC_TYPES:
+            return self.__dict__
+        packed = pack_coordinates(self.coordinates, PACK_MIN_NUMBERS)
+        if packed is None:
+            return self.__dict__
+        state = self.__dict__.copy()
+        del state['coordinates']
+        state['packed_coordinates'] = packed
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        packed = self.__dict__.pop('packed_coordinates', None)
+        if packed is not None:
+            self.coordinates = unpack_coordinates(packed)
+
+    def representative_point(self):
+        """
+        Return a (lat, lon) for locating this Feature by: the point
+        itself for a Point, otherwise the center of its bounding box.
+        The lon is normalized into [-180..180), so a shape which
+        crosses the antimeridian using wrapped longitudes (e.g. from
+        170 to 190) gets a center near 180 rather than near 0.
+        """
+        if is_numeric(self.coordinates[0]):
+            return (float(self.coordinates[0]), normalize_lon(self.coordinates[1]))
+        lats = []
+        lons = []
+        for (lat, lon) in deep_leaves(self.coordinates):
+            lats.append(lat)
+            lons.append(lon)
+        return ((float(min(lats)) + float(max(lats))) / 2, normalize_lon((float(min(lons)) + float(max(lons))) / 2))
+
+    def geohash(self, precision=12):
+        """ The geohash of representative_point(), precision
+        characters long. Features which share a prefix are in the
+        same geohash cell. """
+        (lat, lon) = self.representative_point()
+        return spatialkeys.geohash(lat, lon, precision)
+
+    def quadkey(self, level=16):
+        """ The quadkey of the map tile at level which contains
+        representative_point(). """
+        (lat, lon) = self.representative_point()
+        return spatialkeys.quadkey(lat, lon, level)
+
+    def hilbert_key(self, order=16):
+        """ The position of representative_point() along a Hilbert
+        curve of the given order. Of the three keys, this one keeps
+        nearby Features closest together when sorted. """
+        (lat, lon) = self.representative_point()
+        return spatialkeys.hilbert_key(lat, lon, order)
+
 
 class Client(object):
     realm = "http://api.simplegeo.com"
     endpoints = {
         'feature': 'features/%(simplegeohandle)s.json',
         'annotations': 'features/%(simplegeohandle)s/annotations.json',
+        'add_feature': 'places',
     }
 
-    def __init__(self, key, secret, api_version=API_VERSION, host="api.simplegeo.com", port=80):
+    def __init__(self, key, secret, api_version=API_VERSION, host="api.simplegeo.com", port=80, limiter=None, hedge=None, cache=None, hosts=None, breaker=None, stale_on_error=False):
+        """
+        limiter is an optional AIMDLimiter (or anything else with its
+        acquire() and release() methods) which every request made by
+        this Client has to get past. Share one limiter among the
+        Clients used by several threads to have them adapt their
+        combined concurrency to what the server can take.
+
+        hedge is an optional HedgePolicy. If it is given then
+        get_feature() and get_annotations() send a second, separately
+        signed, copy of their request when the first one is slow, and
+        use whichever response arrives first.
+
+        cache is an optional FeatureCache. If it is given then
+        get_feature() and get_annotations() return what is in it
+        instead of making a request, as long as it is fresh, and store
+        what they get from the server in it.
+
+        hosts is an optional list of several hosts serving the API,
+        each a host name (reached on port) or a (host name, port)
+        tuple, or a HostPool made from such a list. If it is given
+        then host is ignored, and each request goes to the host
+        chosen by the HostPool; see HostPool for how it chooses and
+        for how it stops using hosts which fail.
+
+        breaker is an optional CircuitBreaker. If it is given then
+        requests to an endpoint which keeps failing raise
+        CircuitOpenError at once instead of being sent.
+
+        If stale_on_error is True and this Client has a cache, then
+        when get_feature() or get_annotations() fails because the
+        server is unavailable (a socket error or timeout, a 5xx or 429
+        response, or CircuitOpenError) it returns the cached copy,
+        however old, if there is one. stale_served counts how many
+        times that has happened.
+        """
+        if hosts is not None and not isinstance(hosts, HostPool):
+            hosts = HostPool(hosts, default_port=port)
+        self.hosts = hosts
+        if hosts is not None:
+            # URLs are built (and responses cached) under the first
+            # host, and moved to the chosen host when sent.
+            host = hosts.hosts[0].host
+            port = hosts.hosts[0].port
         self.host = host
         self.port = port
         self.consumer = oauth.Consumer(key, secret)
@@ -236,8 +702,22 @@ class Client(object):
         self.api_version = api_version
         self.signature = oauth.SignatureMethod_HMAC_SHA1()
         self.uri = "http://%s:%s" % (host, port)
-        self.http = Http()
+        self.http = self._make_http()
         self.headers = None
+        self.limiter = limiter
+        self.hedge = hedge
+        self.cache = cache
+        self.breaker = breaker
+        self.stale_on_error = stale_on_error
+        self.stale_served = 0
+        # Spare transports for requests made concurrently with those on
+        # self.http: hedged requests, add_features() and Prefetcher.
+        self._spare_https = []
+        # Set by warm_up().
+        self.dns_cache = None
+        self._keepalive_stop = None
+        # The process which the transports belong to; see _after_fork().
+        self._pid = os.getpid()
 
     def get_most_recent_http_headers(self):
         """ Intended for debugging -- return the most recent HTTP
@@ -256,18 +736,178 @@ class Client(object):
             raise TypeError('Missing required argument "%s"' % (e.args[0],))
         return urljoin(urljoin(self.uri, self.api_version + '/'), endpoint)
 
-    def get_feature(self, simplegeohandle):
-        """Return the GeoJSON representation of a feature."""
+    def _make_http(self):
+        return Http()
+
+    def _after_fork(self):
+        """
+        Not used directly. If this is a child process forked (e.g. by
+        multiprocessing) after this Client was made, then its
+        transports hold sockets which are shared with the parent, so
+        drop them and start again with new ones. The keep-alive
+        thread of warm_up() doesn't survive a fork, and isn't
+        restarted; the DNS cache is kept.
+        """
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+        self._pid = pid
+        self.http = self._make_http()
+        self._spare_https = []
+        self._keepalive_stop = None
+
+    def _checkout_http(self):
+        """ Not used directly. Take a spare transport (or a new one if
+        there are none) for a request made concurrently with others.
+        Give it back with _checkin_http(). """
+        self._after_fork()
+        try:
+            return self._spare_https.pop()
+        except IndexError:
+            return self._make_http()
+
+    def _checkin_http(self, http):
+        self._spare_https.append(http)
+
+    def _uris(self):
+        """ Not used directly. The uri of every host which this Client
+        sends requests to. """
+        if self.hosts is None:
+            return [self.uri]
+        return [host.uri for host in self.hosts.hosts]
+
+    def _conn_key(self, uri=None):
+        """ Not used directly. The key under which an Http object keeps
+        its connection to uri (by default, this Client's host). """
+        scheme, authority = urlnorm((uri or self.uri) + '/')[:2]
+        return scheme + ":" + authority
+
+    def _make_connection(self, authority, **kwargs):
+        """ Not used directly. Passed to Http.request() as its
+        connection_type once warm_up() has made a DNS cache. """
+        return CachedDNSConnection(authority, dns_cache=self.dns_cache, **kwargs)
+
+    def _open_connection(self, http, uri=None):
+        """ Not used directly. Make sure that http has an open
+        connection to uri (by default, this Client's host). """
+        key = self._conn_key(uri)
+        conn = http.connections.get(key)
+        if conn is None:
+            conn = http.connections[key] = self._make_connection(key.split(':', 1)[1], timeout=http.timeout)
+        if conn.sock is None:
+            conn.connect()
+
+    def warm_up(self, connections=2, dns_ttl=300, keepalive_interval=30):
+        """
+        Get ready so that the first requests are as fast as later ones.
+
+        Look up host once and cache its addresses for dns_ttl seconds,
+        for every connection this Client opens from now on. Then open
+        the connection of self.http, plus connections spare keep-alive
+        connections for concurrent requests (see add_features(),
+        Prefetcher and HedgePolicy). With several hosts, this is done
+        for each of them.
+
+        If keepalive_interval is not None then a background thread
+        checks the spare connections every keepalive_interval seconds
+        and reopens those that the server has closed. Call close() to
+        stop it.
+        """
+        if self.dns_cache is None:
+            self.dns_cache = DNSCache(dns_ttl)
+        else:
+            self.dns_cache.ttl = dns_ttl
+        uris = self._uris()
+        if self.hosts is None:
+            self.dns_cache.resolve(self.host, self.port)
+        else:
+            for host in self.hosts.hosts:
+                self.dns_cache.resolve(host.host, host.port)
+        for uri in uris:
+            self._open_connection(self.http, uri)
+        for i in range(connections):
+            http = self._make_http()
+            for uri in uris:
+                self._open_connection(http, uri)
+            self._checkin_http(http)
+        if keepalive_interval is not None and self._keepalive_stop is None:
+            self._keepalive_stop = threading.Event()
+            t = threading.Thread(target=self._keep_alive, args=(keepalive_interval, self._keepalive_stop))
+            t.setDaemon(True)
+            t.start()
+
+    def _keep_alive(self, interval, stop):
+        keys = [self._conn_key(uri) for uri in self._uris()]
+        while True:
+            stop.wait(interval)
+            if stop.isSet():
+                return
+            # Only look at the transports which aren't in use.
+            https = []
+            while True:
+                try:
+                    https.append(self._spare_https.pop())
+                except IndexError:
+                    break
+            for http in https:
+                for key in keys:
+                    conn = http.connections.get(key)
+                    if conn is not None and not is_connection_alive(conn):
+                        conn.close()
+                        try:
+                            conn.connect()
+                        except EnvironmentError:
+                            # It will be reconnected when it is next used.
+                            pass
+                self._checkin_http(http)
+
+    def close(self):
+        """ Stop the keep-alive thread started by warm_up(), if any,
+        and close the connections of this Client's transports. """
+        if self._keepalive_stop is not None:
+            self._keepalive_stop.set()
+            self._keepalive_stop = None
+        for http in [self.http] + self._spare_https:
+            connections = getattr(http, 'connections', None)
+            if isinstance(connections, dict):
+                for conn in connections.values():
+                    conn.close()
+
+    def get_feature(self, simplegeohandle, simplify_tolerance=None, precision=None, decimal_to_float=False):
+        """Return the GeoJSON representation of a feature.
+
+        simplify_tolerance, precision and decimal_to_float optionally
+        reduce the geometry as it is decoded; see Feature.from_dict().
+        """
         if not is_simplegeohandle(simplegeohandle):
             raise TypeError("simplegeohandle is required to match the regex %s, but it was %s :: %r" % (SIMPLEGEOHANDLE_RSTR, type(simplegeohandle), simplegeohandle))
         endpoint = self._endpoint('feature', simplegeohandle=simplegeohandle)
-        return Feature.from_json(self._request(endpoint, 'GET')[1])
+        def decode(body):
+            return Feature.from_json(body, simplify_tolerance=simplify_tolerance, precision=precision, decimal_to_float=decimal_to_float)
+        return self._cached_get(endpoint, decode, 'feature', serve_stale=self.stale_on_error)
+
+    def prefetch_feature(self, simplegeohandle, http=None):
+        """
+        Fetch a feature into the cache, unless a fresh copy of it is
+        already there. Returns True if it was fetched. http is the
+        transport to use instead of self.http, so that several threads
+        can prefetch at once; see Prefetcher.
+        """
+        if self.cache is None:
+            raise ValueError("prefetch_feature() requires this Client to have a cache")
+        if not is_simplegeohandle(simplegeohandle):
+            raise TypeError("simplegeohandle is required to match the regex %s, but it was %s :: %r" % (SIMPLEGEOHANDLE_RSTR, type(simplegeohandle), simplegeohandle))
+        endpoint = self._endpoint('feature', simplegeohandle=simplegeohandle)
+        if endpoint in self.cache:
+            return False
+        self._cached_get(endpoint, Feature.from_json, 'feature', http=http)
+        return True
 
     def get_annotations(self, simplegeohandle):
         if not is_simplegeohandle(simplegeohandle):
             raise TypeError("simplegeohandle is required to match the regex %s, but it was %s :: %r" % (SIMPLEGEOHANDLE_RSTR, type(simplegeohandle), simplegeohandle))
         endpoint = self._endpoint('annotations', simplegeohandle=simplegeohandle)
-        return json.loads(self._request(endpoint, 'GET')[1])
+        return self._cached_get(endpoint, json.loads, 'annotations', serve_stale=self.stale_on_error)
 
     def annotate(self, simplegeohandle, annotations, private):
         if not isinstance(annotations, dict):
@@ -286,19 +926,211 @@ class Client(object):
         endpoint = self._endpoint('annotations', simplegeohandle=simplegeohandle)
         return json.loads(self._request(endpoint,
                                         'POST',
-                                        data=json.dumps(data))[1])
+                                        data=json.dumps(data),
+                                        name='annotations')[1])
 
-    def _request(self, endpoint, method, data=None):
+    def add_feature(self, feature):
+        """
+        Add feature to the Places database and return the
+        simplegeohandle that was assigned to it. See the Feature
+        class for the meaning of its record_id and 'private'
+        properties.
+        """
+        return self._add_feature(feature)
+
+    def add_features(self, features, concurrency=4, index=None):
+        """
+        Add every Feature in the iterable features (which may be a
+        generator) to the Places database, with up to concurrency
+        POSTs in flight at once, each worker thread using its own
+        keep-alive connection. features is consumed only as fast as
+        the POSTs complete.
+
+        If index is a RecordIndex then Features which it says have
+        already been added unchanged are not sent again, and every
+        Feature which is added is recorded in it. Each Feature with a
+        record_id is then serialized only once, for both the index and
+        the POST.
+
+        A failure to add one Feature doesn't stop the others. Returns
+        a tuple of (list of the simplegeohandles in the same order as
+        features, with None for those which failed, dict mapping the
+        position of every failed Feature to its exception).
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency is required to be at least 1, but it was: %r" % (concurrency,))
+        handles = []
+        errors = {}
+        tasks = Queue.Queue(maxsize=2 * concurrency)
+        def work():
+            http = self._checkout_http()
+            try:
+                while True:
+                    task = tasks.get()
+                    if task is None:
+                        return
+                    i, feature, data, chash = task
+                    try:
+                        handles[i] = self._add_feature(feature, http=http, data=data)
+                    except Exception, le:
+                        errors[i] = le
+                    else:
+                        if chash is not None:
+                            index.add_hash(feature.properties['record_id'], chash, handles[i])
+            finally:
+                self._checkin_http(http)
+
+        workers = [threading.Thread(target=work) for i in range(concurrency)]
+        for t in workers:
+            t.setDaemon(True)
+            t.start()
+        try:
+            for i, feature in enumerate(features):
+                handles.append(None)
+                data = chash = None
+                if index is not None and isinstance(feature, Feature) and feature.properties.get('record_id') is not None:
+                    content = content_json(feature)
+                    chash = hash_content_json(content)
+                    handles[i] = index.lookup_hash(feature.properties['record_id'], chash)
+                    if handles[i] is not None:
+                        continue
+                    # The same JSON, with the id put back.
+                    data = '{"id": %s, %s' % (json.dumps(feature.id), content[1:])
+                tasks.put((i, feature, data, chash))
+        finally:
+            for t in workers:
+                tasks.put(None)
+            for t in workers:
+                t.join()
+        return handles, errors
+
+    def _add_feature(self, feature, http=None, data=None):
+        # data is the JSON of feature, if the caller already has it.
+        if not isinstance(feature, Feature):
+            raise TypeError("feature is required to be a Feature, but it was: %r :: %s" % (feature, type(feature)))
+        if data is None:
+            data = feature.to_json()
+        endpoint = self._endpoint('add_feature')
+        body = self._request(endpoint, 'POST', data=data, http=http, name='add_feature')[1]
+        result = json_decode(body)
+        simplegeohandle = isinstance(result, dict) and result.get('id')
+        if not is_simplegeohandle(simplegeohandle):
+            raise DecodeError(body, ValueError("The response is required to have a simplegeohandle as its 'id', but it was: %r" % (simplegeohandle,)))
+        return simplegeohandle
+
+    def _cached_get(self, endpoint, decode, name, http=None, serve_stale=False):
+        """
+        Not used directly. GET endpoint (possibly hedged), whose
+        name in self.endpoints is name, and return decode(body). If
+        this Client has a cache then a fresh body from the cache is
+        used instead, and a body which decodes successfully is stored
+        in the cache. If serve_stale is True then a stale body from
+        the cache is used if the server is unavailable.
+        """
+        cache = self.cache
+        if cache is not None:
+            body = cache.get(endpoint)
+            if body is not None:
+                return decode(body)
+        try:
+            body = self._request(endpoint, 'GET', hedge=True, http=http, name=name)[1]
+        except Exception, le:
+            if not (serve_stale and cache is not None and is_unavailable_error(le)):
+                raise
+            exc_info = sys.exc_info()
+            body = cache.get_stale(endpoint)
+            if body is None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            self.stale_served += 1
+            return decode(body)
+        result = decode(body)
+        if cache is not None:
+            cache.put(endpoint, body)
+        return result
+
+    def _request(self, endpoint, method, data=None, hedge=False, http=None, name=None):
         """
         Not used directly by code external to this lib. Performs the
         actual request against the API, including passing the
         credentials with oauth.  Returns a tuple of (headers as dict,
         body as string).
+
+        data is sent as utf-8 encoded bytes; an ascii string (such as
+        produced by json.dumps()) is sent without being copied. If the
+        server responds with an error then at most ERROR_BODY_LIMIT
+        characters of its response are kept in the APIError.
+
+        If hedge is True, method is GET and this Client has a
+        HedgePolicy, then the request may be hedged (see
+        _hedged_send()). Only pass hedge=True for idempotent requests.
+
+        http is the transport to use if not self.http.
+
+        name is the name of the endpoint in self.endpoints; it is
+        what this Client's CircuitBreaker, if any, keeps a circuit
+        for (the whole URL is used if name is None). If the circuit
+        is open then CircuitOpenError is raised without a request
+        being sent.
         """
+        self._after_fork()
         if data is not None:
-            data = to_unicode(data)
+            data = to_utf8(data)
+
+        breaker = self.breaker
+        if breaker is not None:
+            circuit = name or endpoint
+            ticket = breaker.allow(circuit)
+            if not ticket:
+                raise CircuitOpenError(circuit)
+            start = time.time()
+        failed = True
+        try:
+            if hedge and self.hedge is not None and method == 'GET':
+                headers, content = self._hedged_send(endpoint, method)
+            else:
+                if http is None:
+                    http = self.http
+                headers, content = self._send(http, endpoint, method, data)
+            failed = is_overload_status(int(headers['status']))
+        finally:
+            if breaker is not None:
+                breaker.record(circuit, time.time() - start, failed, ticket)
+        self.headers = headers
+
+        if headers['status'][0] not in ('2', '3'):
+            raise APIError(int(headers['status']), truncate_body(content), headers)
+
+        return headers, content
+
+    def _send(self, http, endpoint, method, body=None):
+        """
+        Not used directly. Sign a request, get it past the limiter (if
+        any) and send it with http. Returns a tuple of (headers as
+        dict, body as string), whatever the status.
+
+        If this Client has several hosts then the request is moved to
+        the one chosen by self.hosts before it is signed, so that the
+        signature is for the URL which is actually requested.
+        """
+        pool = self.hosts
+        if pool is not None:
+            host = pool.acquire()
+            if endpoint.startswith(self.uri + '/'):
+                endpoint = host.uri + endpoint[len(self.uri):]
+            start = time.time()
+            failed = True
+            try:
+                response, content = self._send_signed(http, endpoint, method, body)
+                failed = is_overload_status(int(response['status']))
+            finally:
+                pool.release(host, time.time() - start, failed)
+            return response, content
+        return self._send_signed(http, endpoint, method, body)
+
+    def _send_signed(self, http, endpoint, method, body=None):
+        """ Not used directly. The part of _send() which is the same
+        whichever host endpoint is on. """
         params = {}
-        body = data
         request = oauth.Request.from_consumer_and_token(self.consumer,
             http_method=method, http_url=endpoint, parameters=params)
 
@@ -306,12 +1138,83 @@ class Client(object):
         headers = request.to_header(self.realm)
         headers['User-Agent'] = 'SimpleGeo Places Client v%s' % __version__
 
-        self.headers, content = self.http.request(endpoint, method, body=body, headers=headers)
+        limiter = self.limiter
+        if limiter is not None:
+            limiter.acquire()
+        start = time.time()
+        dropped = True
+        try:
+            if self.dns_cache is None:
+                response, content = http.request(endpoint, method, body=body, headers=headers)
+            else:
+                response, content = http.request(endpoint, method, body=body, headers=headers, connection_type=self._make_connection)
+            dropped = is_overload_status(int(response['status']))
+        finally:
+            if limiter is not None:
+                limiter.release(time.time() - start, dropped)
+        return response, content
+
+    def _hedged_send(self, endpoint, method):
+        """
+        Not used directly. Like _send(), but if the request hasn't
+        completed after the delay chosen by self.hedge, and the
+        hedging budget allows, send a second copy of it and return
+        whichever good response arrives first. A response is good
+        unless it is an exception or says that the server is
+        overloaded; if neither attempt is good then the outcome of
+        the last one is used.
+
+        Each attempt runs in its own thread with its own transport.
+        The losing attempt cannot be interrupted in the middle of its
+        HTTP exchange, so it is abandoned: its response is discarded
+        and its transport is put back for reuse once it completes. A
+        request which self.hedge says won't be hedged is just sent
+        with self.http, on the calling thread.
+        """
+        delay = self.hedge.next_delay()
+        if delay is None:
+            start = time.time()
+            response = self._send(self.http, endpoint, method)
+            self.hedge.record(time.time() - start)
+            return response
 
-        if self.headers['status'][0] not in ('2', '3'):
-            raise APIError(int(self.headers['status']), content, self.headers)
+        results = Queue.Queue()
+        def attempt():
+            http = self._checkout_http()
+            start = time.time()
+            try:
+                try:
+                    response = self._send(http, endpoint, method)
+                except Exception:
+                    results.put((None, sys.exc_info()))
+                else:
+                    self.hedge.record(time.time() - start)
+                    results.put((response, None))
+            finally:
+                self._checkin_http(http)
+        def launch():
+            t = threading.Thread(target=attempt)
+            t.setDaemon(True)
+            t.start()
 
-        return self.headers, content
+        launch()
+        attempts = 1
+        try:
+            outcome = results.get(True, delay)
+        except Queue.Empty:
+            if self.hedge.allow_hedge():
+                launch()
+                attempts += 1
+            outcome = results.get()
+        received = 1
+        while received < attempts and (outcome[1] is not None or is_overload_status(int(outcome[0][0]['status']))):
+            outcome = results.get()
+            received += 1
+
+        response, exc_info = outcome
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return response
 
 
 class APIError(Exception):
@@ -331,19 +1234,81 @@ class APIError(Exception):
 
 class DecodeError(APIError):
     """There was a problem decoding the API's response, which was
-    supposed to be encoded in JSON, but which apparently wasn't."""
+    supposed to be encoded in JSON, but which apparently wasn't.
+
+    Only the first ERROR_BODY_LIMIT characters of the body are kept,
+    in the body attribute; body_length is the length of the whole
+    thing."""
 
     def __init__(self, body, le):
         super(DecodeError, self).__init__(None, "Could not decode JSON from server.", None, repr(le))
-        self.body = body
+        self.body = truncate_body(body)
+        self.body_length = hasattr(body, '__len__') and len(body) or 0
 
     def __repr__(self):
         return "%s content: %s" % (self.description, self.body)
 
+class CircuitOpenError(APIError):
+    """The request wasn't sent, because the CircuitBreaker of the
+    Client has stopped requests to the endpoint, which has been
+    failing. The endpoint attribute is the name of the endpoint."""
+
+    def __init__(self, endpoint):
+        super(CircuitOpenError, self).__init__(None, "Circuit open.", None, "Requests to %s are failing, so it isn't being sent any for now." % (endpoint,))
+        self.endpoint = endpoint
+
+def is_unavailable_error(le):
+    """ True if the exception le, raised by a request, means that
+    the server is unavailable or overloaded rather than that there is
+    anything wrong with the request. """
+    if isinstance(le, CircuitOpenError):
+        return True
+    if isinstance(le, APIError):
+        return le.code is not None and is_overload_status(le.code)
+    return isinstance(le, (EnvironmentError, httplib.HTTPException, HttpLib2Error))
+
+_OCTET_RSTR = r"(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])"
+IPV4_R = re.compile(r"%s(?:\.%s){3}\Z" % (_OCTET_RSTR, _OCTET_RSTR))
+
+# is_valid_ip() remembers this many of the strings it has seen.
+IP_CACHE_SIZE = 10000
+_ip_cache = {}
+
 def is_valid_ip(ip):
+    """
+    True if ip is an IPv4 or IPv6 address (or integer) that
+    ipaddr.IPAddress() accepts. Ordinary dotted-quad IPv4 strings are
+    recognized without calling ipaddr, and the answers for strings
+    are memoized.
+    """
+    if isinstance(ip, basestring):
+        try:
+            return _ip_cache[ip]
+        except KeyError:
+            pass
+        if IPV4_R.match(ip):
+            result = True
+        elif '.' not in ip and ':' not in ip:
+            result = False
+        else:
+            result = _is_valid_ip_slow(ip)
+        if len(_ip_cache) >= IP_CACHE_SIZE:
+            _ip_cache.clear()
+        _ip_cache[ip] = result
+        return result
+    return _is_valid_ip_slow(ip)
+
+def _is_valid_ip_slow(ip):
     try:
         ipaddr.IPAddress(ip)
     except ValueError:
         return False
     else:
         return True
+
+def are_valid_ips(ips):
+    """
+    Return a list of bools saying whether each element of ips is a
+    valid IP address according to is_valid_ip().
+    """
+    return [is_valid_ip(ip) for ip in ips]
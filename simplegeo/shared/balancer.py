@@ -0,0 +1,151 @@
+import random, threading, time
+
+class Host(object):
+    """ One of the hosts of a HostPool, and what the pool knows about
+    it. """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.uri = "http://%s:%s" % (host, port)
+        self.outstanding = 0
+        self.ewma = None # seconds
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = None
+        self.eject_seconds = None
+        self.probing = False
+
+    def __repr__(self):
+        return "<Host %s>" % (self.uri,)
+
+class HostPool(object):
+    """
+    Spreads the requests of a Client over several hosts which serve
+    the same API.
+
+    hosts is a list whose items are each a host name, which is
+    reached on default_port, or a (host name, port) tuple.
+
+    With the 'least_outstanding' policy each request goes to the host
+    with the fewest requests in flight. With the 'ewma' policy it goes
+    to the host with the lowest exponentially weighted moving average
+    of its latency (each new latency counting for ewma_weight of it),
+    multiplied by one more than the number of requests in flight, so
+    that a fast host isn't swamped. Ties go to the host which has had
+    the fewest requests, then are broken at random.
+
+    A host which fails failure_threshold requests in a row (with a
+    socket error or timeout, or with a 5xx or 429 response) is ejected
+    for eject_seconds. After that the next request that would go to it
+    is sent as a probe, and no other request goes to it until the
+    probe completes: if the probe succeeds the host is back in the
+    pool, else it is ejected again for twice as long as before, up to
+    max_eject_seconds. If every host is ejected then requests go to
+    the one which is due back first rather than failing outright.
+    """
+    POLICIES = ('least_outstanding', 'ewma')
+
+    def __init__(self, hosts, default_port=80, policy='least_outstanding', ewma_weight=0.3, failure_threshold=3, eject_seconds=10, max_eject_seconds=300):
+        if not hosts:
+            raise ValueError("hosts is required to be a non-empty list, but it was: %r" % (hosts,))
+        if policy not in self.POLICIES:
+            raise ValueError("policy is required to be one of %s, but it was: %r" % (self.POLICIES, policy))
+        if not (0 < ewma_weight <= 1):
+            raise ValueError("ewma_weight is required to be between 0 and 1, but it was: %r" % (ewma_weight,))
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold is required to be at least 1, but it was: %r" % (failure_threshold,))
+        self.hosts = []
+        for h in hosts:
+            if isinstance(h, basestring):
+                self.hosts.append(Host(h, default_port))
+            else:
+                self.hosts.append(Host(*h))
+        self.policy = policy
+        self.ewma_weight = ewma_weight
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self._lock = threading.Lock()
+
+    def _load(self, host):
+        # Of equally loaded hosts, prefer the one which has had the
+        # fewest requests.
+        if self.policy == 'ewma':
+            return ((host.ewma or 0.0) * (host.outstanding + 1), host.requests)
+        return (host.outstanding, host.requests)
+
+    def acquire(self):
+        """ Choose the host for a request, count the request as in
+        flight on it and return it. Pass it to release() when the
+        request is done. """
+        self._lock.acquire()
+        try:
+            now = time.time()
+            available = []
+            for host in self.hosts:
+                if host.ejected_until is None:
+                    available.append(host)
+                elif host.ejected_until <= now and not host.probing:
+                    # Due back: send this request as its probe.
+                    host.probing = True
+                    host.outstanding += 1
+                    return host
+            if available:
+                least = min([self._load(host) for host in available])
+                host = random.choice([host for host in available if self._load(host) == least])
+            else:
+                host = min(self.hosts, key=lambda host: host.ejected_until)
+            host.outstanding += 1
+            return host
+        finally:
+            self._lock.release()
+
+    def release(self, host, latency, failed=False):
+        """ Count a request, which acquire() sent to host, as finished
+        after latency seconds, and eject or reinstate host as needed. """
+        self._lock.acquire()
+        try:
+            host.outstanding -= 1
+            host.requests += 1
+            if host.ewma is None:
+                host.ewma = latency
+            else:
+                host.ewma += self.ewma_weight * (latency - host.ewma)
+            probe = host.probing
+            host.probing = False
+            if not failed:
+                host.consecutive_failures = 0
+                if probe:
+                    host.ejected_until = None
+                    host.eject_seconds = None
+                return
+            host.failures += 1
+            host.consecutive_failures += 1
+            if probe:
+                host.eject_seconds = min(self.max_eject_seconds, host.eject_seconds * 2)
+            elif host.ejected_until is None and host.consecutive_failures >= self.failure_threshold:
+                host.eject_seconds = self.eject_seconds
+            else:
+                return
+            host.ejected_until = time.time() + host.eject_seconds
+            host.ejections += 1
+        finally:
+            self._lock.release()
+
+    def get_metrics(self):
+        """ Return a dict mapping the uri of each host to a dict of its
+        requests in flight, latency EWMA, total requests and failures,
+        number of times it was ejected and whether it is ejected now. """
+        metrics = {}
+        for host in self.hosts:
+            metrics[host.uri] = {
+                'outstanding': host.outstanding,
+                'ewma': host.ewma,
+                'requests': host.requests,
+                'failures': host.failures,
+                'ejections': host.ejections,
+                'ejected': host.ejected_until is not None,
+                }
+        return metrics
@@ -0,0 +1,165 @@
+import threading, time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class _Circuit(object):
+    def __init__(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trials = 0
+        self.half_opens = 0 # the number of the current half-open period
+
+class _Ticket(object):
+    """ What allow() returns for a request it lets through. trial is
+    the number of the half-open period the request is a trial of, or
+    None if it isn't a trial. """
+    def __init__(self, trial=None):
+        self.trial = trial
+
+    def __repr__(self):
+        return "<_Ticket trial=%r>" % (self.trial,)
+
+_ORDINARY = _Ticket()
+
+class CircuitBreaker(object):
+    """
+    Stops a Client from sending requests to an endpoint which is
+    failing, so that they fail at once instead of each waiting for
+    the server (or for the socket timeout).
+
+    Every endpoint (e.g. 'feature' or 'annotations') has its own
+    circuit. It starts closed, letting requests through. After
+    failure_threshold failures in a row it opens: a request fails if
+    it raises a socket error or timeout, if the response is a 5xx or
+    429, or, if latency_threshold is not None, if it takes longer than
+    latency_threshold seconds. While it is open, allow() refuses every
+    request.
+
+    After reset_timeout seconds the circuit is half open and allows up
+    to half_open_trials requests in flight as trials. If one of them
+    succeeds, the circuit closes. If one fails, it opens again for
+    another reset_timeout. Only the trials decide: a request which was
+    let through before the circuit opened counts towards the failures
+    in a row, but doesn't close or reopen the circuit when it finishes
+    late.
+
+    If on_transition is given then it is called with the endpoint and
+    the old and new states (CLOSED, OPEN or HALF_OPEN) at every
+    change, outside of the breaker's lock. get_metrics() counts the
+    changes too.
+    """
+    def __init__(self, failure_threshold=5, latency_threshold=None, reset_timeout=30, half_open_trials=1, on_transition=None):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold is required to be at least 1, but it was: %r" % (failure_threshold,))
+        if half_open_trials < 1:
+            raise ValueError("half_open_trials is required to be at least 1, but it was: %r" % (half_open_trials,))
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_trials = half_open_trials
+        self.on_transition = on_transition
+        self.rejected = 0
+        self.transitions = {} # (old state, new state) -> count
+        self._circuits = {} # endpoint -> _Circuit
+        self._lock = threading.Lock()
+
+    def _circuit(self, endpoint):
+        circuit = self._circuits.get(endpoint)
+        if circuit is None:
+            circuit = self._circuits.setdefault(endpoint, _Circuit())
+        return circuit
+
+    def _transition(self, endpoint, circuit, state, changes):
+        # Called with the lock held.
+        changes.append((endpoint, circuit.state, state))
+        key = (circuit.state, state)
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        circuit.state = state
+        if state == OPEN:
+            circuit.opened_at = time.time()
+        circuit.trials = 0
+
+    def _notify(self, changes):
+        if self.on_transition is not None:
+            for change in changes:
+                self.on_transition(*change)
+
+    def state(self, endpoint):
+        """ The state of the circuit of endpoint, as far as it is
+        known without a request being made. """
+        return self._circuit(endpoint).state
+
+    def allow(self, endpoint):
+        """
+        Return a ticket (which is true), and count a request as in
+        flight, if a request to endpoint may be sent now. Pass its
+        outcome and the ticket to record() once it is done. Return
+        False if the request should fail at once.
+        """
+        changes = []
+        self._lock.acquire()
+        try:
+            circuit = self._circuit(endpoint)
+            if circuit.state == OPEN:
+                if time.time() - circuit.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self._transition(endpoint, circuit, HALF_OPEN, changes)
+                circuit.half_opens += 1
+            if circuit.state == HALF_OPEN:
+                if circuit.trials >= self.half_open_trials:
+                    self.rejected += 1
+                    return False
+                circuit.trials += 1
+                return _Ticket(circuit.half_opens)
+            return _ORDINARY
+        finally:
+            self._lock.release()
+            self._notify(changes)
+
+    def record(self, endpoint, latency, failed=False, ticket=None):
+        """ Count a request, which allow() let through with ticket, as
+        finished after latency seconds, and open or close the circuit
+        as needed. If ticket is None the request is taken not to be a
+        half-open trial. """
+        if self.latency_threshold is not None and latency > self.latency_threshold:
+            failed = True
+        changes = []
+        self._lock.acquire()
+        try:
+            circuit = self._circuit(endpoint)
+            if circuit.state == HALF_OPEN and ticket is not None and ticket.trial == circuit.half_opens:
+                circuit.trials -= 1
+                if failed:
+                    self._transition(endpoint, circuit, OPEN, changes)
+                else:
+                    self._transition(endpoint, circuit, CLOSED, changes)
+                    circuit.consecutive_failures = 0
+            elif not failed:
+                circuit.consecutive_failures = 0
+            else:
+                # Unless the circuit is closed, only its trials open or
+                # close it.
+                circuit.consecutive_failures += 1
+                if circuit.state == CLOSED and circuit.consecutive_failures >= self.failure_threshold:
+                    self._transition(endpoint, circuit, OPEN, changes)
+        finally:
+            self._lock.release()
+            self._notify(changes)
+
+    def get_metrics(self):
+        """ Return a dict of the state of each endpoint's circuit, the
+        number of requests refused, and the number of each kind of
+        state change, e.g. 'closed->open'. """
+        self._lock.acquire()
+        try:
+            return {
+                'states': dict([(endpoint, circuit.state) for (endpoint, circuit) in self._circuits.items()]),
+                'rejected': self.rejected,
+                'transitions': dict([('%s->%s' % key, count) for (key, count) in self.transitions.items()]),
+                }
+        finally:
+            self._lock.release()
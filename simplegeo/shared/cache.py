@@ -0,0 +1,102 @@
+import threading, time
+
+# The fields of the entries of the linked list which FeatureCache keeps
+# in least to most recently used order. (collections.OrderedDict would
+# do, but Python 2.6 doesn't have it.)
+PREV, NEXT, KEY, STORED, BODY = range(5)
+
+class FeatureCache(object):
+    """
+    A thread-safe least-recently-used cache of API response bodies,
+    keyed by URL, holding at most max_entries of them.
+
+    An entry which is more than ttl seconds old is stale: get()
+    ignores it, but get_stale() still returns it until it is evicted
+    or replaced.
+    """
+    def __init__(self, max_entries=100000, ttl=3600):
+        if max_entries < 1:
+            raise ValueError("max_entries is required to be at least 1, but it was: %r" % (max_entries,))
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {} # key -> [prev, next, key, time stored, body]
+        # The sentinel of the circular list; its NEXT is the least
+        # recently used entry and its PREV the most.
+        self._root = root = [None, None, None, None, None]
+        root[PREV] = root[NEXT] = root
+        self._lock = threading.Lock()
+
+    def _unlink(self, entry):
+        entry[PREV][NEXT] = entry[NEXT]
+        entry[NEXT][PREV] = entry[PREV]
+
+    def _append(self, entry):
+        root = self._root
+        last = root[PREV]
+        entry[PREV] = last
+        entry[NEXT] = root
+        last[NEXT] = root[PREV] = entry
+
+    def _lookup(self, key, allow_stale):
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if not allow_stale and time.time() - entry[STORED] > self.ttl:
+                # Left where it is, so that it doesn't push out fresh
+                # entries.
+                self.misses += 1
+                return None
+            self._unlink(entry)
+            self._append(entry)
+            self.hits += 1
+            return entry[BODY]
+        finally:
+            self._lock.release()
+
+    def get(self, key):
+        """ Return the body cached under key, or None if there is no
+        fresh one. """
+        return self._lookup(key, False)
+
+    def get_stale(self, key):
+        """ Return the body cached under key, however old, or None if
+        there is none. """
+        return self._lookup(key, True)
+
+    def put(self, key, body):
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._unlink(entry)
+            entry = self._entries[key] = [None, None, key, time.time(), body]
+            self._append(entry)
+            while len(self._entries) > self.max_entries:
+                oldest = self._root[NEXT]
+                self._unlink(oldest)
+                del self._entries[oldest[KEY]]
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key):
+        """ True if there is a fresh body cached under key. This
+        doesn't count as a hit or miss or make the entry more
+        recently used. """
+        entry = self._entries.get(key)
+        return entry is not None and time.time() - entry[STORED] <= self.ttl
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_metrics(self):
+        """ Return a dict of the number of entries, hits and misses. """
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            }
@@ -0,0 +1,83 @@
+import select, socket, threading, time
+
+import httplib2
+
+class DNSCache(object):
+    """
+    Remembers the addresses that a (host, port) resolves to for ttl
+    seconds, so that new connections don't each need a DNS lookup.
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {} # (host, port) -> (time resolved, getaddrinfo() result)
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """ Return what socket.getaddrinfo() returns for a TCP
+        connection to host and port, looking it up only if it isn't
+        cached or is more than ttl seconds old. """
+        entry = self._entries.get((host, port))
+        if entry is not None and time.time() - entry[0] <= self.ttl:
+            return entry[1]
+        addrs = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        self._lock.acquire()
+        try:
+            self._entries[(host, port)] = (time.time(), addrs)
+        finally:
+            self._lock.release()
+        return addrs
+
+    def invalidate(self, host, port):
+        self._lock.acquire()
+        try:
+            self._entries.pop((host, port), None)
+        finally:
+            self._lock.release()
+
+class CachedDNSConnection(httplib2.HTTPConnectionWithTimeout):
+    """
+    An httplib2 HTTP connection which gets the address to connect to
+    from dns_cache (a DNSCache) instead of looking it up every time.
+    If it can't connect to any of the cached addresses then the cache
+    entry is dropped, so that the next attempt looks the host up
+    again.
+    """
+    def __init__(self, host, port=None, strict=None, timeout=None, proxy_info=None, dns_cache=None):
+        httplib2.HTTPConnectionWithTimeout.__init__(self, host, port, strict, timeout, proxy_info)
+        self.dns_cache = dns_cache
+
+    def connect(self):
+        if self.dns_cache is None or (self.proxy_info and self.proxy_info.isgood()):
+            return httplib2.HTTPConnectionWithTimeout.connect(self)
+        err = socket.error("getaddrinfo returned no addresses for %s" % (self.host,))
+        for af, socktype, proto, canonname, sa in self.dns_cache.resolve(self.host, self.port):
+            sock = None
+            try:
+                sock = socket.socket(af, socktype, proto)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                if httplib2.has_timeout(self.timeout):
+                    sock.settimeout(self.timeout)
+                sock.connect(sa)
+            except socket.error, err:
+                if sock is not None:
+                    sock.close()
+            else:
+                self.sock = sock
+                return
+        self.dns_cache.invalidate(self.host, self.port)
+        raise err
+
+def is_connection_alive(conn):
+    """
+    True if conn has an open socket which the server hasn't closed. An
+    idle keep-alive socket should never be readable, so if it is then
+    the server has closed it (or sent something unexpected).
+    """
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        return False
+    try:
+        readable = select.select([sock], [], [], 0)[0]
+    except (select.error, socket.error, ValueError):
+        return False
+    return not readable
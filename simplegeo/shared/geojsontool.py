@@ -0,0 +1,331 @@
+"""
+Validate and normalize large GeoJSON dumps using all of the cores of
+the machine.
+
+The input is either line-delimited GeoJSON (one Feature per line) or a
+single FeatureCollection. It is split into chunks which are validated
+(and optionally re-emitted as normalized GeoJSON) by a pool of worker
+processes. A FeatureCollection is never decoded as a whole: the text
+of each of its Features is cut out of the stream and decoded by a
+worker, just like a line. Results are written back out in the same order as the
+input, one Feature per line, and every record which fails is reported
+as a line of JSON in the error report.
+
+Installed as the "simplegeo-geojson" command; run it with --help for
+the options.
+"""
+
+import re, sys
+from collections import deque
+from optparse import OptionParser
+
+from pyutil import jsonutil as json
+
+from simplegeo.shared import Feature, deep_swap, json_decode
+
+FORMATS = ('auto', 'lines', 'collection')
+
+# How the start of a FeatureCollection looks, for auto-detection.
+FEATURECOLLECTION_R = re.compile(r'\s*\{\s*"(?:type"\s*:\s*"FeatureCollection"|features"\s*:)')
+
+# The tokens which split_collection() has to look at: strings (which
+# may contain any of the others) and punctuation. A lone quote is the
+# start of a string which continues past the end of the buffer.
+_TOKEN_R = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\],:"]')
+
+class InputError(ValueError):
+    """ The input as a whole (rather than one record of it) is
+    malformed. """
+
+def process_record(record, strict_lon_validation=False, swap_axes=False, emit=False):
+    """
+    record is either a GeoJSON string or an already-decoded GeoJSON
+    dict. Raise an exception if it isn't a valid Feature. Otherwise
+    return its normalized GeoJSON if emit is True, else None.
+
+    If swap_axes is True then the coordinates in record are taken to
+    be in (lat, lon) order instead of the GeoJSON order of (lon, lat).
+    """
+    if isinstance(record, basestring):
+        data = json_decode(record)
+    else:
+        data = record
+    if not isinstance(data, dict):
+        raise TypeError("record is required to be a GeoJSON object, not: %s" % (type(data),))
+    if swap_axes:
+        data['geometry']['coordinates'] = deep_swap(data['geometry']['coordinates'])
+    feature = Feature.from_dict(data, strict_lon_validation=strict_lon_validation)
+    if emit:
+        return feature.to_json()
+
+def process_chunk(args):
+    """
+    Run process_record() over a chunk of records. args is a tuple of
+    (number of the first record, list of records, dict of keyword
+    arguments for process_record()). Blank string records are
+    skipped.
+
+    Returns a tuple of (list of outputs, list of (record number, error
+    message)).
+    """
+    start, records, kwargs = args
+    outputs = []
+    errors = []
+    for i, record in enumerate(records):
+        if isinstance(record, basestring) and not record.strip():
+            continue
+        try:
+            output = process_record(record, **kwargs)
+        except Exception, le:
+            errors.append((start + i, "%s: %s" % (type(le).__name__, le)))
+        else:
+            if output is not None:
+                outputs.append(output)
+    return outputs, errors
+
+def split_collection(infile, head='', bufsize=65536):
+    """
+    Yield the text of each element of the "features" array of the
+    FeatureCollection read from infile (after the text head, which
+    has already been read from it), without decoding the collection.
+    Only the structure of the JSON is followed, so this is much
+    cheaper than decoding it. Raises InputError if the input isn't a
+    JSON object with "type": "FeatureCollection".
+    """
+    buf = head
+    pos = 0
+    eof = False
+    stack = []
+    closed = False
+    expect_key = False
+    key = None
+    collectiontype = None
+    in_features = False
+    elemstart = None
+    while not buf.strip():
+        data = infile.read(bufsize)
+        if not data:
+            break
+        buf += data
+    if not buf.lstrip().startswith('{'):
+        raise InputError("input is required to be line-delimited GeoJSON Features or a FeatureCollection")
+    while True:
+        m = _TOKEN_R.search(buf, pos)
+        if m is None or m.group() == '"':
+            if eof:
+                if m is not None:
+                    raise InputError("the input ends inside a string")
+                break
+            # Read more, keeping the text of the current element.
+            if m is None:
+                pos = len(buf)
+            else:
+                pos = m.start()
+            keep = pos
+            if in_features:
+                keep = min(elemstart, pos)
+            buf = buf[keep:]
+            pos -= keep
+            if in_features:
+                elemstart -= keep
+            data = infile.read(bufsize)
+            if not data:
+                eof = True
+            buf += data
+            continue
+        token = m.group()
+        pos = m.end()
+        depth = len(stack)
+        if closed:
+            raise InputError("there is more after the end of the FeatureCollection")
+        if token == '{' or token == '[':
+            stack.append(token)
+            if depth == 0:
+                expect_key = True
+            elif depth == 1 and token == '[' and key == 'features':
+                in_features = True
+                elemstart = pos
+        elif token == '}' or token == ']':
+            if not stack:
+                raise InputError("unbalanced %r in the input" % (token,))
+            stack.pop()
+            if in_features and depth == 2:
+                text = buf[elemstart:m.start()].strip()
+                if text:
+                    yield text
+                in_features = False
+            elif depth == 1:
+                closed = True
+        elif token == ',':
+            if depth == 1:
+                expect_key = True
+            elif in_features and depth == 2:
+                yield buf[elemstart:m.start()].strip()
+                elemstart = pos
+        elif token == ':':
+            pass
+        elif depth == 1:
+            # A string which is a key or a value of the top level object.
+            if expect_key:
+                key = json.loads(token)
+                expect_key = False
+            elif key == 'type':
+                collectiontype = json.loads(token)
+    if stack:
+        raise InputError("the input ends before the FeatureCollection does")
+    if collectiontype != 'FeatureCollection':
+        raise InputError("input is required to be line-delimited GeoJSON Features or a FeatureCollection")
+
+def iter_records(infile, format='auto'):
+    """
+    Yield the records of infile one at a time, as strings. For
+    line-delimited input blank lines are yielded too, so that the
+    position of a record is its line number. For a FeatureCollection
+    the text of each Feature is yielded; see split_collection().
+
+    In 'auto' format the input is taken to be a FeatureCollection
+    only if it starts like one, i.e. with an object whose first key is
+    "type" with the value "FeatureCollection", or is "features".
+    Anything else is read as lines, so a bad first line is reported
+    like any other bad record.
+    """
+    if format not in FORMATS:
+        raise ValueError("format is required to be one of %s, not: %r" % (FORMATS, format))
+    if format == 'lines':
+        for line in infile:
+            yield line
+        return
+
+    head = []
+    if format == 'auto':
+        # Read enough to see the first key of a pretty-printed
+        # collection. readline() because iterating over a file and
+        # then calling read() on it loses data.
+        while len(head) < 100:
+            line = infile.readline()
+            if not line:
+                break
+            head.append(line)
+            text = ''.join(head).strip()
+            if len(text) >= 64 or (text and not text.startswith('{')):
+                break
+        if not FEATURECOLLECTION_R.match(''.join(head)):
+            for line in head:
+                yield line
+            for line in infile:
+                yield line
+            return
+
+    for text in split_collection(infile, ''.join(head)):
+        yield text
+
+def iter_chunks(records, chunk_size):
+    """
+    Group records into tuples of (number of the first record, list of
+    records). Records are numbered from 1.
+    """
+    chunk = []
+    start = 1
+    try:
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield start, chunk
+                start += len(chunk)
+                chunk = []
+    except InputError:
+        # The records before the point where the input went bad are
+        # still worth processing.
+        exc_info = sys.exc_info()
+        if chunk:
+            yield start, chunk
+        raise exc_info[0], exc_info[1], exc_info[2]
+    if chunk:
+        yield start, chunk
+
+def process_all(records, jobs=None, chunk_size=1000, **kwargs):
+    """
+    Yield the result of process_chunk() for every chunk of records, in
+    input order. If jobs is not 1 then the chunks are processed by a
+    multiprocessing.Pool of that many workers (None meaning one per
+    CPU), keeping at most two chunks per worker in flight so that the
+    input is consumed no faster than it can be processed.
+    """
+    tasks = ((start, chunk, kwargs) for (start, chunk) in iter_chunks(records, chunk_size))
+    if jobs == 1:
+        for task in tasks:
+            yield process_chunk(task)
+        return
+
+    from multiprocessing import Pool, cpu_count
+    if jobs is None:
+        try:
+            jobs = cpu_count()
+        except NotImplementedError:
+            jobs = 1
+    pool = Pool(jobs)
+    try:
+        pending = deque()
+        try:
+            for task in tasks:
+                pending.append(pool.apply_async(process_chunk, (task,)))
+                if len(pending) >= 2 * jobs:
+                    yield pending.popleft().get()
+        except InputError:
+            exc_info = sys.exc_info()
+            while pending:
+                yield pending.popleft().get()
+            raise exc_info[0], exc_info[1], exc_info[2]
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def main(argv=None, stdin=None, stdout=None, stderr=None):
+    parser = OptionParser(usage="%prog [options] [INFILE]", description="Validate line-delimited GeoJSON Features or a GeoJSON FeatureCollection, optionally writing them back out as normalized line-delimited GeoJSON.")
+    parser.add_option('-f', '--format', choices=FORMATS, default='auto', help="input format: auto, lines or collection (default: %default)")
+    parser.add_option('-o', '--output', metavar='FILE', help="write normalized GeoJSON Features here, one per line (default: standard out)")
+    parser.add_option('-n', '--no-emit', dest='emit', action='store_false', default=True, help="only validate; don't write out the Features")
+    parser.add_option('-e', '--errors', metavar='FILE', help="write a line of JSON for every invalid record here (default: standard error)")
+    parser.add_option('-s', '--strict-lon', dest='strict_lon_validation', action='store_true', default=False, help="require longitudes to be in [-180..180] instead of [-360..360]")
+    parser.add_option('-x', '--swap-axes', action='store_true', default=False, help="the input coordinates are in (lat, lon) order instead of GeoJSON (lon, lat) order")
+    parser.add_option('-j', '--jobs', type='int', default=None, help="number of worker processes (default: one per CPU)")
+    parser.add_option('-c', '--chunk-size', type='int', default=1000, help="number of records handed to a worker at a time (default: %default)")
+    options, args = parser.parse_args(argv)
+    if len(args) > 1:
+        parser.error("at most one INFILE may be given")
+    if options.jobs is not None and options.jobs < 1:
+        parser.error("--jobs is required to be at least 1")
+    if options.chunk_size < 1:
+        parser.error("--chunk-size is required to be at least 1")
+
+    if args and args[0] != '-':
+        infile = open(args[0], 'rb')
+    else:
+        infile = stdin or sys.stdin
+    outfile = options.output and open(options.output, 'wb') or stdout or sys.stdout
+    errfile = options.errors and open(options.errors, 'wb') or stderr or sys.stderr
+
+    numerrors = 0
+    results = process_all(iter_records(infile, options.format), jobs=options.jobs, chunk_size=options.chunk_size, strict_lon_validation=options.strict_lon_validation, swap_axes=options.swap_axes, emit=options.emit)
+    try:
+        for outputs, errors in results:
+            for output in outputs:
+                outfile.write(output)
+                outfile.write('\n')
+            for (recordnum, msg) in errors:
+                errfile.write(json.dumps({'record': recordnum, 'error': msg}))
+                errfile.write('\n')
+            numerrors += len(errors)
+    except InputError, le:
+        # Reported as an error of no record in particular.
+        errfile.write(json.dumps({'record': None, 'error': "%s: %s" % (type(le).__name__, le)}))
+        errfile.write('\n')
+        numerrors += 1
+    outfile.flush()
+    errfile.flush()
+    return numerrors and 1 or 0
+
+if __name__ == '__main__':
+    sys.exit(main())
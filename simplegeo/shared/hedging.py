@@ -0,0 +1,78 @@
+import threading
+from collections import deque
+
+class HedgePolicy(object):
+    """
+    Decides when a Client should "hedge" an idempotent request by
+    sending a second copy of it if the first hasn't completed yet.
+
+    If delay is not None then the second copy is sent after that many
+    seconds. Otherwise it is sent after the given percentile of the
+    latencies of the last window requests, once at least min_samples
+    latencies have been seen (until then nothing is hedged).
+
+    At most budget (a fraction, e.g. 0.05 for 5%) of all requests are
+    hedged.
+    """
+    def __init__(self, delay=None, percentile=95, budget=0.05, window=1000, min_samples=20):
+        if not (0 < percentile < 100):
+            raise ValueError("percentile is required to be between 0 and 100, but it was: %r" % (percentile,))
+        if not (0 <= budget <= 1):
+            raise ValueError("budget is required to be between 0 and 1, but it was: %r" % (budget,))
+        self.delay = delay
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        """ Remember how many seconds a completed request took. """
+        self._lock.acquire()
+        try:
+            self._latencies.append(latency)
+        finally:
+            self._lock.release()
+
+    def next_delay(self):
+        """
+        Count a new request and return how many seconds to wait for it
+        before hedging it, or None if it shouldn't be hedged (which it
+        isn't while the budget is used up).
+        """
+        self._lock.acquire()
+        try:
+            self.requests += 1
+            if self.hedges >= self.budget * self.requests:
+                return None
+            if self.delay is not None:
+                return self.delay
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        finally:
+            self._lock.release()
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100.0))]
+
+    def allow_hedge(self):
+        """
+        Return True, and count a hedge, if hedging one more request
+        stays within the budget.
+        """
+        self._lock.acquire()
+        try:
+            if self.hedges >= self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+        finally:
+            self._lock.release()
+
+    def get_metrics(self):
+        """ Return a dict of the number of requests and of hedges. """
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            }
@@ -0,0 +1,98 @@
+import threading, time
+
+class AIMDLimiter(object):
+    """
+    Limits how many requests may be in flight at once, and adjusts
+    that limit to what the server can take using Additive Increase,
+    Multiplicative Decrease: every request which completes without
+    being "dropped" raises the limit by increase/limit (so about
+    increase per limit's worth of requests), and every dropped request
+    multiplies the limit by backoff_ratio.
+
+    A request is dropped if it failed because the server was
+    overloaded (a 5xx or 429 response, or a socket error or timeout)
+    or, if latency_threshold is not None, if it took longer than
+    latency_threshold seconds.
+
+    A single limiter may be shared by several Clients (e.g. one
+    Client per thread) so that together they adapt to the server.
+    The current limit is the "limit" attribute.
+    """
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=200, backoff_ratio=0.9, increase=1.0, latency_threshold=None):
+        if not (1 <= min_limit <= initial_limit <= max_limit):
+            raise ValueError("required: 1 <= min_limit <= initial_limit <= max_limit, but they were: %r, %r, %r" % (min_limit, initial_limit, max_limit))
+        if not (0 < backoff_ratio < 1):
+            raise ValueError("backoff_ratio is required to be between 0 and 1, but it was: %r" % (backoff_ratio,))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.increase = increase
+        self.latency_threshold = latency_threshold
+        self._limit = float(initial_limit)
+        self.inflight = 0
+        self.requests = 0
+        self.drops = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self, timeout=None):
+        """
+        Wait until fewer than limit requests are in flight and count
+        one more. Returns False if that didn't happen within timeout
+        seconds (None means wait forever), else True.
+        """
+        self._cond.acquire()
+        try:
+            if timeout is not None:
+                deadline = time.time() + timeout
+            while self.inflight >= self.limit:
+                if timeout is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            self.inflight += 1
+            return True
+        finally:
+            self._cond.release()
+
+    def release(self, latency, dropped=False):
+        """
+        Count a request, which was admitted by acquire(), as finished
+        after latency seconds, and adjust the limit.
+        """
+        self._cond.acquire()
+        try:
+            if self.latency_threshold is not None and latency > self.latency_threshold:
+                dropped = True
+            self.requests += 1
+            if dropped:
+                self.drops += 1
+                self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+            elif self.inflight * 2 >= self._limit:
+                # Only grow if we are actually using the limit we have.
+                self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+            self.inflight -= 1
+            self._cond.notifyAll()
+        finally:
+            self._cond.release()
+
+    def get_metrics(self):
+        """ Return a dict of the current limit, the number of requests in
+        flight and the total number of requests and of dropped ones. """
+        return {
+            'limit': self.limit,
+            'inflight': self.inflight,
+            'requests': self.requests,
+            'drops': self.drops,
+            }
+
+def is_overload_status(status):
+    """ True if an HTTP status code means that the server is
+    overloaded, i.e. 429 (Too Many Requests) or any 5xx. """
+    return status == 429 or 500 <= status < 600
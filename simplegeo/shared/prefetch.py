@@ -0,0 +1,160 @@
+import threading, time
+
+class Prefetcher(object):
+    """
+    Warms the cache of a Client in the background by fetching a known
+    set of features into it, e.g. at deploy time before the service
+    starts taking traffic.
+
+    simplegeohandles is any iterable of simplegeohandles, such as a
+    list or an open file with one per line (surrounding whitespace and
+    blank lines are ignored). Handles whose feature is already fresh
+    in the cache are skipped.
+
+    At most concurrency features are fetched at once, each thread
+    with its own transport, and if rate is not None then no more than
+    rate fetches are started per second. If on_progress is given then
+    it is called with get_progress() after every report_every handles,
+    and once more at the end.
+
+    Call start() to begin, and wait() or is_ready() to find out when
+    warm-up is over. cancel() stops it early.
+    """
+    def __init__(self, client, simplegeohandles, concurrency=4, rate=None, on_progress=None, report_every=1000):
+        if client.cache is None:
+            raise ValueError("a Prefetcher requires the Client to have a cache")
+        if concurrency < 1:
+            raise ValueError("concurrency is required to be at least 1, but it was: %r" % (concurrency,))
+        if rate is not None and rate <= 0:
+            raise ValueError("rate is required to be None or positive, but it was: %r" % (rate,))
+        self.client = client
+        self.concurrency = concurrency
+        self.rate = rate
+        self.on_progress = on_progress
+        self.report_every = report_every
+        self.fetched = 0
+        self.skipped = 0
+        self.failed = 0
+        self.last_error = None
+        self.started_at = None
+        self.finished_at = None
+        self._handles = iter(simplegeohandles)
+        self._lock = threading.Lock()
+        self._next_slot = 0
+        self._running = 0
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    def start(self):
+        """ Start the worker threads and return immediately. """
+        self._lock.acquire()
+        try:
+            if self.started_at is not None:
+                raise ValueError("this Prefetcher has already been started")
+            self.started_at = time.time()
+            self._running = self.concurrency
+        finally:
+            self._lock.release()
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._work)
+            t.setDaemon(True)
+            t.start()
+        return self
+
+    def cancel(self):
+        """ Stop fetching. Fetches already in progress are completed. """
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.isSet()
+
+    def is_ready(self):
+        """ True once every handle has been dealt with (and warm-up
+        wasn't cancelled). """
+        return self._finished.isSet() and not self._cancelled.isSet()
+
+    def wait(self, timeout=None):
+        """
+        Block until warm-up is over, whether because it is done or
+        because it was cancelled, or until timeout seconds have
+        passed. Returns True if warm-up is over.
+        """
+        self._finished.wait(timeout)
+        return self._finished.isSet()
+
+    def get_progress(self):
+        """ Return a dict of how many handles have been fetched,
+        skipped (because they were already cached) and failed, and of
+        how many seconds warm-up has taken so far. """
+        end = self.finished_at or time.time()
+        return {
+            'fetched': self.fetched,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'elapsed': self.started_at and end - self.started_at or 0.0,
+            'ready': self.is_ready(),
+            }
+
+    def _next_handle(self):
+        """ Return the next handle and the time at which it may be
+        fetched, or (None, None) if there are no more. """
+        self._lock.acquire()
+        try:
+            for line in self._handles:
+                handle = line.strip()
+                if handle:
+                    break
+            else:
+                return None, None
+            now = time.time()
+            slot = max(now, self._next_slot)
+            if self.rate is not None:
+                self._next_slot = slot + 1.0 / self.rate
+            return handle, slot
+        finally:
+            self._lock.release()
+
+    def _count(self, attr, error=None):
+        self._lock.acquire()
+        try:
+            setattr(self, attr, getattr(self, attr) + 1)
+            if error is not None:
+                self.last_error = error
+            total = self.fetched + self.skipped + self.failed
+        finally:
+            self._lock.release()
+        if self.on_progress is not None and total % self.report_every == 0:
+            self.on_progress(self.get_progress())
+
+    def _work(self):
+        http = self.client._checkout_http()
+        try:
+            while not self._cancelled.isSet():
+                handle, slot = self._next_handle()
+                if handle is None:
+                    break
+                delay = slot - time.time()
+                if delay > 0:
+                    self._cancelled.wait(delay)
+                    if self._cancelled.isSet():
+                        break
+                try:
+                    fetched = self.client.prefetch_feature(handle, http=http)
+                except Exception, le:
+                    self._count('failed', le)
+                else:
+                    self._count(fetched and 'fetched' or 'skipped')
+        finally:
+            self.client._checkin_http(http)
+            self._lock.acquire()
+            try:
+                self._running -= 1
+                last = self._running == 0
+                if last:
+                    self.finished_at = time.time()
+            finally:
+                self._lock.release()
+            if last:
+                self._finished.set()
+                if self.on_progress is not None:
+                    self.on_progress(self.get_progress())
@@ -0,0 +1,131 @@
+import os, struct
+from hashlib import md5
+
+from pyutil import jsonutil as json
+
+MAGIC = 'SGRI1\n'
+_ENTRY = struct.Struct('!16s16sH')
+
+def content_json(feature):
+    """
+    Return everything about feature that gets submitted to the
+    server, i.e. its GeoJSON except for its id (the simplegeohandle,
+    which the server assigns), as JSON with its keys sorted.
+    """
+    d = feature.to_dict()
+    del d['id']
+    return json.dumps(d, sort_keys=True)
+
+def hash_content_json(jsonstr):
+    """ Return the 16-byte digest of jsonstr, as returned by
+    content_json(), which the index keeps. """
+    return md5(jsonstr).digest()
+
+def content_hash(feature):
+    """ Return the 16-byte digest of content_json(feature). """
+    return hash_content_json(content_json(feature))
+
+def _key(record_id):
+    if isinstance(record_id, unicode):
+        record_id = record_id.encode('utf-8')
+    return md5(record_id).digest()
+
+class RecordIndex(object):
+    """
+    Remembers, for every record_id that has been submitted, a hash of
+    the Feature that was submitted and the simplegeohandle that the
+    server assigned to it, so that a Feature which hasn't changed
+    since it was last submitted needn't be sent again.
+
+    To stay compact with millions of records, record_ids are stored
+    as 16-byte digests, and each entry is a single string holding the
+    content hash followed by the simplegeohandle.
+
+    Use save() and load() to keep the index on disk between runs.
+    """
+    def __init__(self):
+        self._entries = {}
+
+    def lookup(self, feature):
+        """
+        Return the simplegeohandle that was assigned to feature if it
+        has been submitted before with exactly the same contents, else
+        None (also if it has no record_id).
+        """
+        record_id = feature.properties.get('record_id')
+        if record_id is None:
+            return None
+        return self.lookup_hash(record_id, content_hash(feature))
+
+    def lookup_hash(self, record_id, chash):
+        """ Like lookup(), for the Feature with record_id whose
+        content_hash() is chash. """
+        entry = self._entries.get(_key(record_id))
+        if entry is None or entry[:16] != chash:
+            return None
+        return entry[16:]
+
+    def add(self, feature, simplegeohandle):
+        """ Remember that feature was submitted and assigned
+        simplegeohandle. """
+        record_id = feature.properties.get('record_id')
+        if record_id is None:
+            raise ValueError("only a Feature with a record_id can be indexed")
+        self.add_hash(record_id, content_hash(feature), simplegeohandle)
+
+    def add_hash(self, record_id, chash, simplegeohandle):
+        """ Like add(), for the Feature with record_id whose
+        content_hash() is chash. """
+        if isinstance(simplegeohandle, unicode):
+            simplegeohandle = simplegeohandle.encode('utf-8')
+        self._entries[_key(record_id)] = chash + simplegeohandle
+
+    def discard(self, record_id):
+        self._entries.pop(_key(record_id), None)
+
+    def __contains__(self, record_id):
+        return _key(record_id) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def save(self, path):
+        """ Write the index to path, replacing whatever was there
+        only once the new index has been completely written. """
+        tmppath = path + '.tmp'
+        f = open(tmppath, 'wb')
+        try:
+            f.write(MAGIC)
+            for key, entry in self._entries.iteritems():
+                f.write(_ENTRY.pack(key, entry[:16], len(entry) - 16))
+                f.write(entry[16:])
+        finally:
+            f.close()
+        os.rename(tmppath, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Return the index which was saved to path, or an empty one
+        if there is no such file. """
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        f = open(path, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        if not data.startswith(MAGIC):
+            raise ValueError("%s is not a saved RecordIndex" % (path,))
+        entries = index._entries
+        offset = len(MAGIC)
+        while offset < len(data):
+            if offset + _ENTRY.size > len(data):
+                raise ValueError("%s is truncated" % (path,))
+            key, chash, handlelen = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+            if offset + handlelen > len(data):
+                raise ValueError("%s is truncated" % (path,))
+            entries[key] = chash + data[offset:offset+handlelen]
+            offset += handlelen
+        return index
@@ -0,0 +1,186 @@
+"""
+Space-filling-curve keys for lat/lon points, which put points that are
+near each other on the Earth near each other in key order, and helpers
+for ordering and sharding batches of Features by them.
+
+Features are usually handled through their geohash(), quadkey() and
+hilbert_key() methods, which use the functions here.
+"""
+
+import math
+from bisect import bisect_left, bisect_right
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Web Mercator, which quadkeys are defined on, doesn't reach the poles.
+MAX_MERCATOR_LAT = 85.05112878
+
+def normalize_lon(lon):
+    """
+    Map a longitude, including one which has "wrapped around" past
+    180 as allowed by is_valid_lon(strict=False), into [-180..180).
+    """
+    lon = float(lon)
+    if -180 <= lon < 180:
+        return lon
+    return (lon + 180) % 360 - 180
+
+def _clip(x, lo, hi):
+    return max(lo, min(hi, x))
+
+def geohash(lat, lon, precision=12):
+    """ Return the geohash of lat, lon with precision characters. """
+    lat = float(lat)
+    lon = normalize_lon(lon)
+    latlo, lathi = -90.0, 90.0
+    lonlo, lonhi = -180.0, 180.0
+    chars = []
+    bits = 0
+    nbits = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lonlo + lonhi) / 2
+            if lon >= mid:
+                bits = bits * 2 + 1
+                lonlo = mid
+            else:
+                bits = bits * 2
+                lonhi = mid
+        else:
+            mid = (latlo + lathi) / 2
+            if lat >= mid:
+                bits = bits * 2 + 1
+                latlo = mid
+            else:
+                bits = bits * 2
+                lathi = mid
+        even = not even
+        nbits += 1
+        if nbits == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            nbits = 0
+    return ''.join(chars)
+
+def quadkey(lat, lon, level=16):
+    """ Return the quadkey of the Web Mercator map tile at the given
+    level (1 to 23) which contains lat, lon. """
+    if not (1 <= level <= 23):
+        raise ValueError("level is required to be between 1 and 23, but it was: %r" % (level,))
+    lat = _clip(float(lat), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    lon = normalize_lon(lon)
+    sinlat = math.sin(math.radians(lat))
+    x = (lon + 180) / 360
+    y = 0.5 - math.log((1 + sinlat) / (1 - sinlat)) / (4 * math.pi)
+    size = 1 << level
+    tilex = _clip(int(x * size), 0, size - 1)
+    tiley = _clip(int(y * size), 0, size - 1)
+    digits = []
+    for i in range(level, 0, -1):
+        mask = 1 << (i - 1)
+        digit = 0
+        if tilex & mask:
+            digit += 1
+        if tiley & mask:
+            digit += 2
+        digits.append('0123'[digit])
+    return ''.join(digits)
+
+def hilbert_key(lat, lon, order=16):
+    """
+    Return the position, in [0..4**order), of lat, lon along a
+    Hilbert curve filling a 2**order by 2**order grid laid over
+    [-180..180) by [-90..90].
+    """
+    n = 1 << order
+    x = _clip(int((normalize_lon(lon) + 180) / 360 * n), 0, n - 1)
+    y = _clip(int((float(lat) + 90) / 180 * n), 0, n - 1)
+    d = 0
+    s = n >> 1
+    while s:
+        rx = (x & s) and 1 or 0
+        ry = (y & s) and 1 or 0
+        d += s * s * ((3 * rx) ^ ry)
+        if not ry:
+            if rx:
+                x = n - 1 - x
+                y = n - 1 - y
+            x, y = y, x
+        s >>= 1
+    return d
+
+# The Feature method which computes each kind of key.
+KEY_METHODS = {
+    'geohash': 'geohash',
+    'quadkey': 'quadkey',
+    'hilbert': 'hilbert_key',
+}
+
+def _key_func(key, kwargs):
+    try:
+        method = KEY_METHODS[key]
+    except KeyError:
+        raise ValueError("key is required to be one of %s, but it was: %r" % (sorted(KEY_METHODS), key))
+    return lambda feature: getattr(feature, method)(**kwargs)
+
+class SpatialKeyIndex(object):
+    """
+    The Features of features sorted by a spatial key, for storing
+    them in a cache-friendly order and for looking them up by key
+    range.
+
+    key is 'geohash', 'quadkey' or 'hilbert'; kwargs (e.g. precision,
+    level or order) are passed to the Feature method which computes
+    it. The sorted keys and Features are the keys and features
+    attributes.
+    """
+    def __init__(self, features, key='hilbert', **kwargs):
+        f = _key_func(key, kwargs)
+        pairs = [(f(feature), i, feature) for (i, feature) in enumerate(features)]
+        pairs.sort()
+        self.key = key
+        self.keys = [k for (k, i, feature) in pairs]
+        self.features = [feature for (k, i, feature) in pairs]
+
+    def __len__(self):
+        return len(self.features)
+
+    def __iter__(self):
+        return iter(self.features)
+
+    def range(self, lo, hi):
+        """ Return the Features whose keys are in [lo..hi]. """
+        return self.features[bisect_left(self.keys, lo):bisect_right(self.keys, hi)]
+
+    def prefix(self, prefix):
+        """ Return the Features inside the geohash or quadkey cell
+        prefix, i.e. those whose keys start with prefix. """
+        if self.key == 'hilbert':
+            raise ValueError("hilbert keys are integers, which have no prefixes; use range()")
+        return self.range(prefix, prefix + '~')
+
+def sort_by_spatial_key(features, key='hilbert', **kwargs):
+    """ Return a list of the Features in features, ordered so that
+    ones which are near each other are (mostly) near each other in the
+    list. See SpatialKeyIndex for the arguments. """
+    return SpatialKeyIndex(features, key, **kwargs).features
+
+def partition_by_spatial_key(features, partitions, key='hilbert', **kwargs):
+    """
+    Split features into the given number of lists of (as nearly as
+    possible) equal size, each of which covers a contiguous range of
+    spatial keys, so that each partition is spatially compact. See
+    SpatialKeyIndex for the other arguments.
+    """
+    if partitions < 1:
+        raise ValueError("partitions is required to be at least 1, but it was: %r" % (partitions,))
+    ordered = sort_by_spatial_key(features, key, **kwargs)
+    size, extra = divmod(len(ordered), partitions)
+    result = []
+    start = 0
+    for i in range(partitions):
+        end = start + size + (i < extra and 1 or 0)
+        result.append(ordered[start:end])
+        start = end
+    return result
@@ -0,0 +1,102 @@
+"""
+A local stand-in for the SimpleGeo API, for exercising Client against
+real sockets. It serves any GET of a feature with EXAMPLE_FEATURE and
+can be told to slow down and to fail with 503 when too many requests
+are in flight, to simulate a saturated server.
+"""
+
+import socket, threading, time
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+EXAMPLE_FEATURE = '{"geometry": {"type": "Point", "coordinates": [-122.4783, 37.8016]}, "type": "Feature", "id": "SG_4bgzicKFmP89tQFGLGZYy0", "properties": {}}'
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self):
+        server = self.server
+        length = int(self.headers.get('content-length') or 0)
+        requestbody = length and self.rfile.read(length) or ''
+        server.lock.acquire()
+        try:
+            server.inflight += 1
+            server.requests += 1
+            inflight = server.inflight
+            server.max_inflight = max(server.max_inflight, inflight)
+        finally:
+            server.lock.release()
+        try:
+            if server.capacity is not None and inflight > server.capacity:
+                time.sleep(server.latency * inflight / server.capacity)
+                status, body = 503, '{"message": "overloaded"}'
+            else:
+                time.sleep(server.latency)
+                status, body = server.handle(self.command, self.path, requestbody)
+        finally:
+            server.lock.acquire()
+            try:
+                server.inflight -= 1
+            finally:
+                server.lock.release()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+class FakeServer(ThreadingMixIn, HTTPServer):
+    """
+    latency is how many seconds each request takes. If capacity is
+    not None then requests beyond that many in flight fail with 503
+    after taking proportionally longer.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0.0, capacity=None):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.latency = latency
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.max_inflight = 0
+        self.requests = 0
+        self._sockets = set()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def handle(self, method, path, body):
+        """ Return (status, body) for a request. Override to change. """
+        return 200, EXAMPLE_FEATURE
+
+    def handle_error(self, request, client_address):
+        # Clients are free to drop their keep-alive connections.
+        pass
+
+    def process_request(self, request, client_address):
+        self._sockets.add(request)
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def start(self):
+        t = threading.Thread(target=self.serve_forever)
+        t.setDaemon(True)
+        t.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        # Make the handler threads of keep-alive connections exit.
+        for sock in list(self._sockets):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
@@ -0,0 +1,93 @@
+import unittest
+from pyutil import jsonutil as json
+from simplegeo.shared import Client, APIError, DecodeError, Feature, RecordIndex
+from simplegeo.shared.test.fakeserver import FakeServer
+from decimal import Decimal as D
+
+import mock
+
+def handle_for(record_id):
+    return 'SG_%022d' % (int(record_id),)
+
+class AddFeatureServer(FakeServer):
+    """ Assigns each added feature a handle made from its record_id,
+    except for record_ids divisible by 7, which fail. """
+    bodies = None
+
+    def handle(self, method, path, body):
+        if method != 'POST' or path != '/1.0/places':
+            return 404, '{"message": "not found"}'
+        if self.bodies is not None:
+            self.bodies.append(json.loads(body))
+        record_id = json.loads(body)['properties']['record_id']
+        if int(record_id) % 7 == 0:
+            return 500, '{"message": "boom"}'
+        return 200, json.dumps({'id': handle_for(record_id)})
+
+def make_features(n):
+    for i in xrange(1, n+1):
+        yield Feature((D('37.8016'), D('-122.4783')), properties={'record_id': str(i)})
+
+class CountingFeature(Feature):
+    """ Counts how many times it's serialized. """
+    dicts = 0
+
+    def to_dict(self):
+        CountingFeature.dicts += 1
+        return Feature.to_dict(self)
+
+class AddFeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = AddFeatureServer(latency=0.005).start()
+        self.client = Client('whatever', 'whatever', host='127.0.0.1', port=self.server.port)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_add_feature(self):
+        self.failUnlessEqual(self.client.add_feature(make_features(1).next()), handle_for(1))
+        self.failUnlessRaises(TypeError, self.client.add_feature, {'not': 'a feature'})
+
+    def test_add_features_in_order(self):
+        handles, errors = self.client.add_features(make_features(50), concurrency=4)
+        self.failUnlessEqual(len(handles), 50)
+        for i, handle in enumerate(handles):
+            if (i+1) % 7 == 0:
+                self.failUnlessEqual(handle, None)
+                self.failUnless(isinstance(errors[i], APIError), errors[i])
+                self.failUnlessEqual(errors[i].code, 500)
+            else:
+                self.failUnlessEqual(handle, handle_for(i+1))
+        self.failUnlessEqual(sorted(errors.keys()), [6, 13, 20, 27, 34, 41, 48])
+        self.failUnless(self.server.max_inflight <= 4, self.server.max_inflight)
+
+    def test_index_skips_unchanged(self):
+        index = RecordIndex()
+        handles, errors = self.client.add_features(make_features(10), concurrency=2, index=index)
+        self.failUnlessEqual(len(index), 9)
+        requests = self.server.requests
+
+        handles2, errors2 = self.client.add_features(make_features(10), concurrency=2, index=index)
+        self.failUnlessEqual(handles2, handles)
+        self.failUnlessEqual(self.server.requests, requests + 1)
+
+    def test_index_serializes_once(self):
+        features = [CountingFeature((D('37.8016'), D('-122.4783')), properties={'record_id': str(i)}) for i in range(1, 7)]
+        expected = [json.loads(f.to_json()) for f in features]
+        CountingFeature.dicts = 0
+        self.server.bodies = []
+        index = RecordIndex()
+        handles, errors = self.client.add_features(features, concurrency=2, index=index)
+        self.failUnlessEqual(errors, {})
+        self.failUnlessEqual(CountingFeature.dicts, 6)
+        key = lambda d: d['properties']['record_id']
+        self.failUnlessEqual(sorted(self.server.bodies, key=key), expected)
+        for f, handle in zip(features, handles):
+            self.failUnlessEqual(index.lookup(f), handle)
+
+    def test_bad_response(self):
+        c = Client('whatever', 'whatever')
+        c.http = mock.Mock()
+        c.http.request.return_value = ({'status': '200'}, '{"uri": "no id here"}')
+        self.failUnlessRaises(DecodeError, c.add_feature, make_features(1).next())
@@ -0,0 +1,136 @@
+import unittest, time
+import oauth2 as oauth
+from simplegeo.shared import Client, Feature, HostPool
+from simplegeo.shared.test.fakeserver import FakeServer
+
+import mock
+
+HANDLE = "SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970"
+
+class HostPoolTest(unittest.TestCase):
+
+    def test_hosts(self):
+        p = HostPool(['a', ('b', 8080)], default_port=81)
+        self.failUnlessEqual([h.uri for h in p.hosts], ['http://a:81', 'http://b:8080'])
+        self.failUnlessRaises(ValueError, HostPool, [])
+        self.failUnlessRaises(ValueError, HostPool, ['a'], policy='random')
+
+    def test_least_outstanding(self):
+        p = HostPool(['a', 'b', 'c'])
+        first = [p.acquire() for i in range(3)]
+        self.failUnlessEqual(set(first), set(p.hosts))
+        p.release(first[1], 0.1)
+        self.failUnless(p.acquire() is first[1])
+
+    def test_ewma(self):
+        p = HostPool(['a', 'b'], policy='ewma', ewma_weight=0.5)
+        a, b = p.hosts
+        a.ewma, b.ewma = 0.1, 0.45
+        for i in range(4):
+            # a's load is 0.1 * (in flight + 1), which stays below 0.45
+            self.failUnless(p.acquire() is a)
+        self.failUnless(p.acquire() is b)
+        p.release(a, 0.3)
+        self.failUnlessAlmostEqual(a.ewma, 0.2)
+
+    def test_eject_and_probe(self):
+        p = HostPool(['a', 'b'], failure_threshold=2, eject_seconds=0.05)
+        a, b = p.hosts
+        p.release(a, 0, failed=True)
+        self.failUnlessEqual(a.ejected_until, None)
+        a.outstanding += 2
+        p.release(a, 0, failed=True)
+        self.failIfEqual(a.ejected_until, None)
+        for i in range(5):
+            self.failUnless(p.acquire() is b)
+        time.sleep(0.06)
+        probe = p.acquire()
+        self.failUnless(probe is a)
+        # While the probe is out, nothing else goes to a.
+        self.failUnless(p.acquire() is b)
+        p.release(a, 0, failed=True)
+        self.failUnlessEqual(a.eject_seconds, 0.1)
+        self.failUnless(p.acquire() is b)
+        time.sleep(0.11)
+        self.failUnless(p.acquire() is a)
+        p.release(a, 0)
+        self.failUnlessEqual(a.ejected_until, None)
+        metrics = p.get_metrics()['http://a:80']
+        self.failUnlessEqual(metrics['ejections'], 2)
+        self.failUnlessEqual(metrics['failures'], 3)
+        self.failIf(metrics['ejected'])
+
+    def test_all_ejected(self):
+        p = HostPool(['a', 'b'], failure_threshold=1, eject_seconds=60)
+        a, b = p.hosts
+        b.outstanding += 1
+        p.release(b, 0, failed=True)
+        a.outstanding += 1
+        p.release(a, 0, failed=True)
+        self.failUnless(p.acquire() is b)
+
+class FailingServer(FakeServer):
+    def handle(self, method, path, body):
+        return 503, '{"message": "down"}'
+
+class MultiHostClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.good = FakeServer().start()
+        self.bad = FailingServer().start()
+
+    def tearDown(self):
+        self.good.stop()
+        self.bad.stop()
+
+    def test_spreads(self):
+        other = FakeServer().start()
+        try:
+            c = Client('whatever', 'whatever', hosts=[('127.0.0.1', self.good.port), ('127.0.0.1', other.port)])
+            for i in range(10):
+                c.get_feature(HANDLE)
+            self.failUnlessEqual((self.good.requests, other.requests), (5, 5))
+        finally:
+            other.stop()
+
+    def test_ejects_failing_host(self):
+        c = Client('whatever', 'whatever', hosts=HostPool([('127.0.0.1', self.bad.port), ('127.0.0.1', self.good.port)], failure_threshold=2, eject_seconds=60))
+        features = 0
+        for i in range(20):
+            try:
+                c.get_feature(HANDLE)
+            except Exception:
+                pass
+            else:
+                features += 1
+        self.failUnlessEqual(self.bad.requests, 2)
+        self.failUnlessEqual(features, 18)
+        self.failUnless(c.hosts.get_metrics()['http://127.0.0.1:%s' % (self.bad.port,)]['ejected'])
+
+    def test_warm_up(self):
+        c = Client('whatever', 'whatever', hosts=[('127.0.0.1', self.good.port), ('127.0.0.1', self.bad.port)])
+        c.warm_up(connections=1, keepalive_interval=None)
+        try:
+            for port in (self.good.port, self.bad.port):
+                conn = c.http.connections['http:127.0.0.1:%s' % (port,)]
+                self.failIf(conn.sock is None)
+        finally:
+            c.close()
+
+class SigningTest(unittest.TestCase):
+
+    def test_signed_for_chosen_host(self):
+        c = Client('key', 'secret', hosts=['a.example.com', 'b.example.com'])
+        self.failUnlessEqual(c._endpoint('feature', simplegeohandle=HANDLE), 'http://a.example.com:80/1.0/features/%s.json' % (HANDLE,))
+        c.hosts.hosts[0].outstanding = 1 # make b the least loaded
+        c.http = mock.Mock()
+        c.http.request.return_value = ({'status': '200'}, Feature((10, 10)).to_json())
+        c.get_feature(HANDLE)
+        url, method = c.http.request.call_args[0]
+        self.failUnlessEqual(url, 'http://b.example.com:80/1.0/features/%s.json' % (HANDLE,))
+        auth = c.http.request.call_args[1]['headers']['Authorization']
+        params = oauth.Request._split_header(auth[len('OAuth '):])
+        params.pop('realm', None)
+        request = oauth.Request(method, url, params)
+        self.failUnless(oauth.SignatureMethod_HMAC_SHA1().check(request, c.consumer, None, params['oauth_signature']))
+        self.failUnlessEqual(c.hosts.hosts[1].requests, 1)
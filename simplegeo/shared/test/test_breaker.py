@@ -0,0 +1,173 @@
+import unittest, time
+from simplegeo.shared import Client, Feature, FeatureCache, CircuitBreaker, CircuitOpenError, APIError
+from simplegeo.shared.breaker import CLOSED, OPEN, HALF_OPEN
+from simplegeo.shared.test.fakeserver import FakeServer, EXAMPLE_FEATURE
+
+HANDLE = "SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970"
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_and_closes(self):
+        changes = []
+        b = CircuitBreaker(failure_threshold=2, reset_timeout=0.05, on_transition=lambda *change: changes.append(change))
+        for i in range(3):
+            ticket = b.allow('feature')
+            self.failUnless(ticket)
+            b.record('feature', 0, (i != 1), ticket)
+        self.failUnlessEqual(b.state('feature'), CLOSED)
+        ticket = b.allow('feature')
+        self.failUnless(ticket)
+        b.record('feature', 0, True, ticket)
+        self.failUnlessEqual(b.state('feature'), OPEN)
+        self.failIf(b.allow('feature'))
+        # Other endpoints have their own circuits.
+        ticket = b.allow('annotations')
+        self.failUnless(ticket)
+        b.record('annotations', 0, False, ticket)
+
+        time.sleep(0.06)
+        ticket = b.allow('feature')
+        self.failUnless(ticket)
+        self.failUnlessEqual(b.state('feature'), HALF_OPEN)
+        # Only one trial at a time.
+        self.failIf(b.allow('feature'))
+        b.record('feature', 0, True, ticket)
+        self.failUnlessEqual(b.state('feature'), OPEN)
+        self.failIf(b.allow('feature'))
+
+        time.sleep(0.06)
+        ticket = b.allow('feature')
+        self.failUnless(ticket)
+        b.record('feature', 0, False, ticket)
+        self.failUnlessEqual(b.state('feature'), CLOSED)
+        self.failUnless(b.allow('feature'))
+
+        self.failUnlessEqual(changes, [
+            ('feature', CLOSED, OPEN),
+            ('feature', OPEN, HALF_OPEN),
+            ('feature', HALF_OPEN, OPEN),
+            ('feature', OPEN, HALF_OPEN),
+            ('feature', HALF_OPEN, CLOSED),
+            ])
+        self.failUnlessEqual(b.get_metrics(), {
+            'states': {'feature': CLOSED, 'annotations': CLOSED},
+            'rejected': 3,
+            'transitions': {'closed->open': 1, 'open->half_open': 2, 'half_open->open': 1, 'half_open->closed': 1},
+            })
+
+    def test_late_requests_dont_decide(self):
+        b = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        # a is let through while the circuit is closed and is still
+        # in flight when b opens it, and when trial is let through.
+        a = b.allow('feature')
+        b.record('feature', 0, True, b.allow('feature'))
+        self.failUnlessEqual(b.state('feature'), OPEN)
+        time.sleep(0.06)
+        trial = b.allow('feature')
+        self.failUnlessEqual(b.state('feature'), HALF_OPEN)
+        b.record('feature', 0, False, a)
+        self.failUnlessEqual(b.state('feature'), HALF_OPEN)
+        self.failIf(b.allow('feature'))
+        b.record('feature', 0, False, trial)
+        self.failUnlessEqual(b.state('feature'), CLOSED)
+
+        # A late failure doesn't reopen a half open circuit either.
+        a = b.allow('feature')
+        b.record('feature', 0, True, b.allow('feature'))
+        time.sleep(0.06)
+        trial = b.allow('feature')
+        b.record('feature', 0, True, a)
+        self.failUnlessEqual(b.state('feature'), HALF_OPEN)
+        b.record('feature', 0, False, trial)
+        self.failUnlessEqual(b.state('feature'), CLOSED)
+
+        # Nor does a trial from an earlier time it was half open.
+        b = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, half_open_trials=2)
+        b.record('feature', 0, True, b.allow('feature'))
+        time.sleep(0.06)
+        old = b.allow('feature')
+        b.record('feature', 0, True, b.allow('feature'))
+        self.failUnlessEqual(b.state('feature'), OPEN)
+        time.sleep(0.06)
+        trial = b.allow('feature')
+        b.record('feature', 0, False, old)
+        self.failUnlessEqual(b.state('feature'), HALF_OPEN)
+        b.record('feature', 0, True, trial)
+        self.failUnlessEqual(b.state('feature'), OPEN)
+
+    def test_latency_threshold(self):
+        b = CircuitBreaker(failure_threshold=2, latency_threshold=1.0)
+        for i in range(2):
+            b.record('feature', 2.0, False, b.allow('feature'))
+        self.failUnlessEqual(b.state('feature'), OPEN)
+
+    def test_bad_arguments(self):
+        self.failUnlessRaises(ValueError, CircuitBreaker, failure_threshold=0)
+        self.failUnlessRaises(ValueError, CircuitBreaker, half_open_trials=0)
+
+class FlakyServer(FakeServer):
+    """ Serves the feature until told to fail with status. """
+    status = None
+
+    def handle(self, method, path, body):
+        if self.status is not None:
+            return self.status, '{"message": "nope"}'
+        return 200, EXAMPLE_FEATURE
+
+class BreakingClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FlakyServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, **kwargs):
+        return Client('whatever', 'whatever', host='127.0.0.1', port=self.server.port, **kwargs)
+
+    def test_fails_fast(self):
+        c = self.client(breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+        self.server.status = 503
+        for i in range(3):
+            self.failUnlessRaises(APIError, c.get_feature, HANDLE)
+        try:
+            c.get_feature(HANDLE)
+        except CircuitOpenError, le:
+            self.failUnlessEqual(le.endpoint, 'feature')
+        else:
+            self.fail("CircuitOpenError wasn't raised")
+        self.failUnlessEqual(self.server.requests, 3)
+        self.failUnlessEqual(c.breaker.state('feature'), OPEN)
+
+    def test_client_errors_dont_open(self):
+        c = self.client(breaker=CircuitBreaker(failure_threshold=1))
+        self.server.status = 404
+        self.failUnlessRaises(APIError, c.get_feature, HANDLE)
+        self.failUnlessEqual(c.breaker.state('feature'), CLOSED)
+
+    def test_serves_stale(self):
+        cache = FeatureCache(ttl=0)
+        c = self.client(cache=cache, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60), stale_on_error=True)
+        self.failUnless(isinstance(c.get_feature(HANDLE), Feature))
+        time.sleep(0.01)
+        self.server.status = 503
+        # Once from the failing request, once with the circuit open.
+        for i in range(2):
+            self.failUnless(isinstance(c.get_feature(HANDLE), Feature))
+        self.failUnlessEqual(c.stale_served, 2)
+        self.failUnlessEqual(self.server.requests, 2)
+        # Nothing cached, so nothing to serve.
+        self.failUnlessRaises(CircuitOpenError, c.get_feature, "SG_4bgzicKFmP89tQFGLGZYy1")
+
+    def test_stale_only_when_unavailable(self):
+        cache = FeatureCache(ttl=0)
+        c = self.client(cache=cache, stale_on_error=True)
+        c.get_feature(HANDLE)
+        time.sleep(0.01)
+        self.server.status = 404
+        self.failUnlessRaises(APIError, c.get_feature, HANDLE)
+        self.failUnlessEqual(c.stale_served, 0)
+
+        c = self.client(cache=cache)
+        self.server.status = 503
+        self.failUnlessRaises(APIError, c.get_feature, HANDLE)
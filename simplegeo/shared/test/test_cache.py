@@ -0,0 +1,94 @@
+import unittest, time
+from StringIO import StringIO
+from simplegeo.shared import Client, Feature, FeatureCache, Prefetcher
+from simplegeo.shared.test.fakeserver import FakeServer, EXAMPLE_FEATURE
+
+import mock
+
+HANDLE = "SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970"
+HANDLES = ["SG_4bgzicKFmP89tQFGLGZY%02d" % i for i in range(20)]
+
+class FeatureCacheTest(unittest.TestCase):
+
+    def test_lru(self):
+        c = FeatureCache(max_entries=2)
+        c.put('a', 'A')
+        c.put('b', 'B')
+        self.failUnlessEqual(c.get('a'), 'A')
+        c.put('c', 'C')
+        self.failUnlessEqual(c.get('b'), None)
+        self.failUnlessEqual(c.get('a'), 'A')
+        self.failUnlessEqual(len(c), 2)
+        self.failUnlessEqual(c.get_metrics(), {'entries': 2, 'hits': 2, 'misses': 1})
+
+    def test_ttl(self):
+        c = FeatureCache(ttl=0.01)
+        c.put('a', 'A')
+        self.failUnless('a' in c)
+        time.sleep(0.02)
+        self.failIf('a' in c)
+        self.failUnlessEqual(c.get('a'), None)
+        self.failUnlessEqual(c.get_stale('a'), 'A')
+
+    def test_stale_miss_isnt_used(self):
+        c = FeatureCache(max_entries=2, ttl=0.05)
+        c.put('a', 'A')
+        time.sleep(0.06)
+        c.put('b', 'B')
+        self.failUnlessEqual(c.get('a'), None)
+        c.put('c', 'C')
+        # The stale a is evicted rather than the fresh b.
+        self.failUnlessEqual(c.get_stale('a'), None)
+        self.failUnlessEqual(c.get('b'), 'B')
+
+    def test_client_uses_cache(self):
+        client = Client('whatever', 'whatever', cache=FeatureCache())
+        client.http = mock.Mock()
+        client.http.request.return_value = ({'status': '200'}, EXAMPLE_FEATURE)
+        f1 = client.get_feature(HANDLE)
+        f2 = client.get_feature(HANDLE)
+        self.failUnlessEqual(client.http.request.call_count, 1)
+        self.failUnlessEqual(f1.coordinates, f2.coordinates)
+        self.failIf(f1 is f2)
+
+    def test_client_doesnt_cache_bad_json(self):
+        client = Client('whatever', 'whatever', cache=FeatureCache())
+        client.http = mock.Mock()
+        client.http.request.return_value = ({'status': '200'}, 'not json')
+        self.failUnlessRaises(Exception, client.get_feature, HANDLE)
+        self.failUnlessEqual(len(client.cache), 0)
+
+class PrefetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer(latency=0.01).start()
+        self.client = Client('whatever', 'whatever', host='127.0.0.1', port=self.server.port, cache=FeatureCache())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_warm_up(self):
+        progress = []
+        infile = StringIO('\n'.join(HANDLES[:10] + ['', 'not a handle', HANDLES[0]]) + '\n')
+        p = Prefetcher(self.client, infile, concurrency=3, on_progress=progress.append, report_every=5).start()
+        self.failUnless(p.wait(10))
+        self.failUnless(p.is_ready())
+        self.failUnlessEqual((p.fetched, p.skipped, p.failed), (10, 1, 1))
+        self.failUnless(isinstance(p.last_error, TypeError), p.last_error)
+        self.failUnlessEqual(len(self.client.cache), 10)
+        self.failUnless(progress[-1]['ready'], progress)
+
+        requests = self.server.requests
+        self.failUnless(isinstance(self.client.get_feature(HANDLES[3]), Feature))
+        self.failUnlessEqual(self.server.requests, requests)
+
+    def test_rate_and_cancel(self):
+        p = Prefetcher(self.client, HANDLES, concurrency=2, rate=20).start()
+        time.sleep(0.2)
+        p.cancel()
+        self.failUnless(p.wait(5))
+        self.failIf(p.is_ready())
+        self.failUnless(1 <= p.fetched <= 6, p.get_progress())
+
+    def test_requires_cache(self):
+        self.failUnlessRaises(ValueError, Prefetcher, Client('whatever', 'whatever'), HANDLES)
@@ -1,6 +1,9 @@
 import unittest
 from pyutil import jsonutil as json
-from simplegeo.shared import Client, APIError, DecodeError, Feature, is_valid_lat, is_valid_lon, is_valid_ip, to_unicode
+import simplegeo.shared
+from simplegeo.shared import Client, APIError, DecodeError, Feature, is_valid_lat, is_valid_lon, is_valid_ip, are_valid_lats, are_valid_lons, are_valid_ips, to_unicode, to_utf8, json_decode
+
+import array
 
 from decimal import Decimal as D
 
@@ -25,6 +28,15 @@ class ToUnicodeTest(unittest.TestCase, ReallyEqualMixin):
         self.failUnlessReallyEqual(to_unicode(u'x'), u'x')
         self.failUnlessReallyEqual(to_unicode('\xe2\x9d\xa4'), u'\u2764')
 
+class ToUTF8Test(unittest.TestCase, ReallyEqualMixin):
+    def test_to_utf8(self):
+        s = '{"ascii": "json"}'
+        self.failUnless(to_utf8(s) is s)
+        self.failUnlessReallyEqual(to_utf8(u'\u2764'), '\xe2\x9d\xa4')
+        self.failUnlessReallyEqual(to_utf8('\xe2\x9d\xa4'), '\xe2\x9d\xa4')
+        self.failUnlessRaises(TypeError, to_utf8, 'non-utf-8 \x92')
+        self.failUnlessRaises(TypeError, to_utf8, {'not': 'a string'})
+
 class LatLonValidationTest(unittest.TestCase):
 
     def test_is_valid_lon(self):
@@ -63,6 +75,26 @@ class LatLonValidationTest(unittest.TestCase):
         self.failIf(is_valid_lat(-90.0002))
         self.failIf(is_valid_lat(D('-90.0002')))
 
+class BatchValidationTest(unittest.TestCase):
+    COORDS = [0, 90, -90, 90.0002, D('-90.0'), D('180.0002'), 180, -180.0, 359.9, 360.0002, -361, True, '10', None, float('nan'), 10L]
+
+    def test_are_valid_lats(self):
+        self.failUnlessEqual(are_valid_lats(self.COORDS), [is_valid_lat(x) for x in self.COORDS])
+        self.failUnlessEqual(are_valid_lats(array.array('d', [0.0, 90.5, -89.0])), [True, False, True])
+
+    def test_are_valid_lons(self):
+        for strict in (True, False):
+            self.failUnlessEqual(are_valid_lons(self.COORDS, strict=strict), [is_valid_lon(x, strict=strict) for x in self.COORDS])
+        self.failUnlessEqual(are_valid_lons(array.array('i', [0, 190, -400]), strict=False), [True, True, False])
+        self.failUnlessEqual(are_valid_lons(array.array('i', [0, 190, -400]), strict=True), [True, False, False])
+
+    def test_are_valid_ips(self):
+        ips = ['1.2.3.4', '01.2.3.4', '255.255.255.255', '256.1.1.1', '1.2.3', '1.2.3.4\n', ' 1.2.3.4', '12345', 12345, u'1.2.3.4', '0.0.0.0', '::1', '2001:db8::1', 'fe80::1%eth0', '::ffff:1.2.3.4', 'i am not an ip address at all', '', None]
+        expected = [simplegeo.shared._is_valid_ip_slow(ip) for ip in ips]
+        self.failUnlessEqual(are_valid_ips(ips), expected)
+        # Again, from the cache.
+        self.failUnlessEqual(are_valid_ips(ips), expected)
+
 class DecodeErrorTest(unittest.TestCase):
     def test_repr(self):
         body = 'this is not json'
@@ -76,6 +108,21 @@ class DecodeErrorTest(unittest.TestCase):
         self.failUnless("Could not decode JSON" in e.msg, repr(e.msg))
         self.failUnless('JSONDecodeError' in repr(e), repr(e))
 
+    def test_body_is_truncated(self):
+        body = 'x' * (simplegeo.shared.ERROR_BODY_LIMIT + 10)
+        try:
+            json_decode(buffer(body))
+        except DecodeError, e:
+            self.failUnlessEqual(e.body, body[:simplegeo.shared.ERROR_BODY_LIMIT])
+            self.failUnlessEqual(e.body_length, len(body))
+        else:
+            self.fail("We were supposed to get a DecodeError.")
+
+    def test_json_decode_buffers(self):
+        # Only the buffer types this Python has; 2.6 has no memoryview.
+        for buftype in simplegeo.shared._BUFFER_TYPES:
+            self.failUnlessEqual(json_decode(buftype('{"a": 1}')), {'a': 1})
+
 class ClientTest(unittest.TestCase):
     def setUp(self):
         self.client = Client(MY_OAUTH_KEY, MY_OAUTH_SECRET, API_VERSION, API_HOST, API_PORT)
@@ -196,6 +243,28 @@ class ClientTest(unittest.TestCase):
         self.assertEqual(mockhttp.method_calls[0][1][0], 'http://api.simplegeo.com:80/%s/features/%s.json' % (API_VERSION, "SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970"))
         self.assertEqual(mockhttp.method_calls[0][1][1], 'GET')
 
+    def test_request_sends_bytes(self):
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '200', 'content-type': 'application/json', }, '{}')
+        self.client.http = mockhttp
+
+        self.client._request("http://thing", 'POST', u'{"heart": "\u2764"}')
+        self.failUnlessEqual(mockhttp.request.call_args[1]['body'], '{"heart": "\xe2\x9d\xa4"}')
+        self.failUnless(isinstance(mockhttp.request.call_args[1]['body'], str))
+
+    def test_error_body_is_truncated(self):
+        body = '{"message": "%s"}' % ('x' * simplegeo.shared.ERROR_BODY_LIMIT,)
+        mockhttp = mock.Mock()
+        mockhttp.request.return_value = ({'status': '500', 'content-type': 'application/json', }, body)
+        self.client.http = mockhttp
+
+        try:
+            self.client._request("http://thing", 'GET')
+        except APIError, e:
+            self.failUnlessEqual(e.msg, body[:simplegeo.shared.ERROR_BODY_LIMIT])
+        else:
+            self.fail("We were supposed to get an APIError.")
+
     def test_APIError(self):
         e = APIError(500, 'whee', {'status': "500"})
         self.failUnlessEqual(e.code, 500)
@@ -0,0 +1,97 @@
+import unittest, os, socket, time
+from simplegeo.shared import Client, Feature, DNSCache, CachedDNSConnection
+from simplegeo.shared.test.fakeserver import FakeServer
+
+import mock
+
+HANDLE = "SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970"
+
+class DNSCacheTest(unittest.TestCase):
+
+    def test_resolve_is_cached(self):
+        dns = DNSCache(ttl=0.05)
+        with mock.patch('socket.getaddrinfo') as getaddrinfo:
+            getaddrinfo.return_value = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 80))]
+            self.failUnlessEqual(dns.resolve('example.com', 80), getaddrinfo.return_value)
+            dns.resolve('example.com', 80)
+            self.failUnlessEqual(getaddrinfo.call_count, 1)
+            time.sleep(0.06)
+            dns.resolve('example.com', 80)
+            self.failUnlessEqual(getaddrinfo.call_count, 2)
+            dns.invalidate('example.com', 80)
+            dns.resolve('example.com', 80)
+            self.failUnlessEqual(getaddrinfo.call_count, 3)
+
+    def test_unreachable_address_invalidates(self):
+        dns = DNSCache()
+        dns._entries[('example.com', 1)] = (time.time(), [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 1))])
+        conn = CachedDNSConnection('example.com', 1, dns_cache=dns)
+        self.failUnlessRaises(socket.error, conn.connect)
+        self.failIf(('example.com', 1) in dns._entries)
+
+class WarmUpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = Client('whatever', 'whatever', host='localhost', port=self.server.port)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_warm_up(self):
+        with mock.patch('socket.getaddrinfo', wraps=socket.getaddrinfo) as getaddrinfo:
+            self.client.warm_up(connections=3, keepalive_interval=None)
+            time.sleep(0.05)
+            self.failUnlessEqual(len(self.server._sockets), 4)
+            self.failUnlessEqual(len(self.client._spare_https), 3)
+
+            self.failUnless(isinstance(self.client.get_feature(HANDLE), Feature))
+            handles, errors = self.client.add_features([], concurrency=3)
+            self.failUnlessEqual(len(self.server._sockets), 4)
+            self.failUnlessEqual(getaddrinfo.call_count, 1)
+
+    def test_keep_alive_reopens_closed_connections(self):
+        self.client.warm_up(connections=2, keepalive_interval=0.05)
+        time.sleep(0.05)
+        for sock in list(self.server._sockets):
+            sock.shutdown(socket.SHUT_RDWR)
+        time.sleep(0.2)
+        self.failUnlessEqual(len(self.server._sockets), 5)
+
+class ForkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer().start()
+        self.client = Client('whatever', 'whatever', host='127.0.0.1', port=self.server.port)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_child_gets_new_transport(self):
+        self.client.get_feature(HANDLE)
+        parent_http = self.client.http
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                try:
+                    os.close(r)
+                    self.client.get_feature(HANDLE)
+                    result = self.client.http is not parent_http and 'ok' or 'same transport'
+                except Exception, le:
+                    result = repr(le)
+                os.write(w, result)
+            finally:
+                os._exit(0)
+        os.close(w)
+        result = os.read(r, 1000)
+        os.close(r)
+        os.waitpid(pid, 0)
+        self.failUnlessEqual(result, 'ok')
+        # The parent's keep-alive connection is still usable, and the
+        # child made its own.
+        self.client.get_feature(HANDLE)
+        self.failUnless(self.client.http is parent_http)
+        self.failUnlessEqual(len(self.server._sockets), 2)
+        self.failUnlessEqual(self.server.requests, 3)
@@ -0,0 +1,80 @@
+import unittest
+from StringIO import StringIO
+from pyutil import jsonutil as json
+from simplegeo.shared.geojsontool import main, iter_records, process_all, split_collection, InputError
+
+GOOD_LINE = '{"geometry": {"type": "Point", "coordinates": [-122.4783, 37.8016]}, "type": "Feature", "id": null, "properties": {"record_id": "a"}}'
+WRAPPED_LINE = '{"geometry": {"type": "Point", "coordinates": [190.9, 65.8]}, "type": "Feature", "id": null, "properties": {"record_id": "b"}}'
+BAD_LINE = '{"geometry": {"type": "Point", "coordinates": [10.0, 91.0]}, "type": "Feature", "id": null, "properties": {}}'
+
+def run(argv, input):
+    stdout, stderr = StringIO(), StringIO()
+    status = main(argv, stdin=StringIO(input), stdout=stdout, stderr=stderr)
+    return status, stdout.getvalue().splitlines(), [json.loads(l) for l in stderr.getvalue().splitlines()]
+
+class GeoJSONToolTest(unittest.TestCase):
+
+    def test_lines(self):
+        input = '\n'.join([GOOD_LINE, '', BAD_LINE, 'not json', WRAPPED_LINE]) + '\n'
+        status, out, errors = run(['-j', '1', '-c', '2'], input)
+        self.failUnlessEqual(status, 1)
+        self.failUnlessEqual([json.loads(l)['properties']['record_id'] for l in out], ['a', 'b'])
+        self.failUnlessEqual([e['record'] for e in errors], [3, 4])
+        self.failUnless(errors[0]['error'].startswith('TypeError'), errors[0])
+
+    def test_strict_lon(self):
+        status, out, errors = run(['-j', '1', '--strict-lon'], WRAPPED_LINE + '\n')
+        self.failUnlessEqual(status, 1)
+        self.failUnlessEqual(out, [])
+        self.failUnlessEqual([e['record'] for e in errors], [1])
+
+    def test_swap_axes(self):
+        swapped = GOOD_LINE.replace('[-122.4783, 37.8016]', '[37.8016, -122.4783]')
+        status, out, errors = run(['-j', '1', '--swap-axes'], swapped)
+        self.failUnlessEqual(status, 0)
+        self.failUnlessEqual(json.loads(out[0])['geometry']['coordinates'], [json.loads('-122.4783'), json.loads('37.8016')])
+
+    def test_collection(self):
+        collection = '{"type": "FeatureCollection",\n "features": [\n%s,\n%s]}' % (GOOD_LINE, BAD_LINE)
+        records = list(iter_records(StringIO(collection)))
+        self.failUnlessEqual(records, [GOOD_LINE, BAD_LINE])
+
+        status, out, errors = run(['-j', '1', '--no-emit'], collection)
+        self.failUnlessEqual(status, 1)
+        self.failUnlessEqual(out, [])
+        self.failUnlessEqual([e['record'] for e in errors], [2])
+
+    def test_bad_first_line(self):
+        for first in ('{"broken', '[1,2]', '"str"', '{', '{"type": "Feature"'):
+            input = '\n'.join([first, GOOD_LINE, WRAPPED_LINE]) + '\n'
+            status, out, errors = run(['-j', '1'], input)
+            self.failUnlessEqual(status, 1)
+            self.failUnlessEqual(len(out), 2, (first, out))
+            self.failUnlessEqual([e['record'] for e in errors], [1], (first, errors))
+
+    def test_pretty_printed_collection(self):
+        collection = '{\n  "features": [\n    %s,\n    %s\n  ],\n  "type": "FeatureCollection"\n}\n' % (GOOD_LINE, WRAPPED_LINE)
+        status, out, errors = run(['-j', '1'], collection)
+        self.failUnlessEqual(status, 0)
+        self.failUnlessEqual(len(out), 2)
+
+    def test_split_collection(self):
+        collection = '{"type": "FeatureCollection", "features": [{"a": "x,]}\\"y", "b": [1, 2]}, {"c": {}} ,1]}\n'
+        for bufsize in (1, 3, 65536):
+            self.failUnlessEqual(list(split_collection(StringIO(collection), bufsize=bufsize)), ['{"a": "x,]}\\"y", "b": [1, 2]}', '{"c": {}}', '1'])
+        for bad in ('{"type": "Feature", "features": []}', '[1]', '{"type": "FeatureCollection", "features": [{}', '{"type": "FeatureCollection"} {}'):
+            self.failUnlessRaises(InputError, list, split_collection(StringIO(bad), bufsize=4))
+
+    def test_malformed_collection_is_reported(self):
+        collection = '{"type": "FeatureCollection", "features": [%s, %s' % (GOOD_LINE, BAD_LINE)
+        for jobs in ('1', '2'):
+            status, out, errors = run(['-j', jobs, '-c', '1', '--format', 'collection'], collection)
+            self.failUnlessEqual(status, 1)
+            self.failUnlessEqual(len(out), 1)
+            self.failUnlessEqual([e['record'] for e in errors], [None])
+
+    def test_pool_preserves_order(self):
+        lines = [GOOD_LINE.replace('"a"', '"%d"' % i) for i in range(50)]
+        results = list(process_all(lines, jobs=2, chunk_size=3, emit=True))
+        out = [json.loads(o)['properties']['record_id'] for (outputs, errors) in results for o in outputs]
+        self.failUnlessEqual(out, [str(i) for i in range(50)])
@@ -0,0 +1,96 @@
+import unittest, time
+from simplegeo.shared import Client, Feature, HedgePolicy
+from simplegeo.shared.test.fakeserver import FakeServer, EXAMPLE_FEATURE
+
+import mock
+
+HANDLE = "SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970"
+
+class HedgePolicyTest(unittest.TestCase):
+
+    def test_learned_delay(self):
+        p = HedgePolicy(percentile=90, min_samples=10)
+        self.failUnlessEqual(p.next_delay(), None)
+        for i in range(1, 11):
+            p.record(i / 10.0)
+        self.failUnlessEqual(p.next_delay(), 1.0)
+        for i in range(1, 11):
+            p.record(i / 100.0)
+        self.failUnlessEqual(p.next_delay(), 0.9)
+
+    def test_fixed_delay(self):
+        p = HedgePolicy(delay=0.25)
+        self.failUnlessEqual(p.next_delay(), 0.25)
+
+    def test_budget(self):
+        p = HedgePolicy(delay=0, budget=0.1)
+        hedges = 0
+        for i in range(100):
+            p.next_delay()
+            if p.allow_hedge():
+                hedges += 1
+        self.failUnlessEqual(hedges, 10)
+        self.failUnlessEqual(p.get_metrics(), {'requests': 100, 'hedges': 10})
+
+    def test_no_delay_without_budget(self):
+        self.failUnlessEqual(HedgePolicy(delay=0.25, budget=0).next_delay(), None)
+        p = HedgePolicy(delay=0.25, budget=0.5)
+        self.failUnlessEqual(p.next_delay(), 0.25)
+        self.failUnless(p.allow_hedge())
+        # One hedge in two requests uses up the budget; in three it
+        # doesn't.
+        self.failUnlessEqual(p.next_delay(), None)
+        self.failUnlessEqual(p.next_delay(), 0.25)
+
+    def test_bad_arguments(self):
+        self.failUnlessRaises(ValueError, HedgePolicy, percentile=100)
+        self.failUnlessRaises(ValueError, HedgePolicy, budget=2)
+
+class SlowFirstServer(FakeServer):
+    """ The first request takes a long time; the rest are fast. """
+    def handle(self, method, path, body):
+        self.lock.acquire()
+        try:
+            first = self.requests == 1
+        finally:
+            self.lock.release()
+        if first:
+            time.sleep(1.0)
+        return 200, EXAMPLE_FEATURE
+
+class HedgedClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SlowFirstServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_hedge_wins(self):
+        hedge = HedgePolicy(delay=0.05, budget=1.0)
+        c = Client('whatever', 'whatever', host='127.0.0.1', port=self.server.port, hedge=hedge)
+        start = time.time()
+        f = c.get_feature(HANDLE)
+        self.failUnless(time.time() - start < 0.9, time.time() - start)
+        self.failUnless(isinstance(f, Feature))
+        self.failUnlessEqual(c.get_most_recent_http_headers()['status'], '200')
+        self.failUnlessEqual(hedge.get_metrics(), {'requests': 1, 'hedges': 1})
+        self.failUnlessEqual(self.server.requests, 2)
+
+    def test_unhedged_on_calling_thread(self):
+        hedge = HedgePolicy(min_samples=20)
+        c = Client('whatever', 'whatever', host='127.0.0.1', port=self.server.port, hedge=hedge)
+        c._checkout_http = mock.Mock(side_effect=AssertionError("a transport was checked out"))
+        c.get_feature(HANDLE)
+        c.get_feature(HANDLE)
+        self.failUnlessEqual(hedge.get_metrics(), {'requests': 2, 'hedges': 0})
+        self.failUnlessEqual(len(hedge._latencies), 2)
+
+    def test_no_hedge_without_budget(self):
+        hedge = HedgePolicy(delay=0.05, budget=0)
+        c = Client('whatever', 'whatever', host='127.0.0.1', port=self.server.port, hedge=hedge)
+        start = time.time()
+        c.get_feature(HANDLE)
+        self.failUnless(time.time() - start >= 1.0, time.time() - start)
+        self.failUnlessEqual(hedge.get_metrics(), {'requests': 1, 'hedges': 0})
+        self.failUnlessEqual(self.server.requests, 1)
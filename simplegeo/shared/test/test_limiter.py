@@ -0,0 +1,88 @@
+import unittest, threading
+from simplegeo.shared import Client, APIError, AIMDLimiter
+from simplegeo.shared.test.fakeserver import FakeServer
+
+import mock
+
+HANDLE = "SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970"
+
+class AIMDLimiterTest(unittest.TestCase):
+
+    def test_increase_and_decrease(self):
+        l = AIMDLimiter(initial_limit=4, min_limit=2, max_limit=5, backoff_ratio=0.5)
+        for i in range(4):
+            self.failUnless(l.acquire(timeout=0))
+        self.failIf(l.acquire(timeout=0.01))
+
+        l.release(0.1)
+        self.failUnlessEqual(l.limit, 4)
+        for i in range(3):
+            l.release(0.1)
+        for i in range(20):
+            l.acquire()
+            l.acquire()
+            l.acquire()
+            l.release(0.1)
+            l.release(0.1)
+            l.release(0.1)
+        self.failUnlessEqual(l.limit, 5)
+
+        l.acquire()
+        l.release(0.1, dropped=True)
+        self.failUnlessEqual(l.limit, 2)
+        l.acquire()
+        l.release(0.1, dropped=True)
+        self.failUnlessEqual(l.limit, 2)
+        self.failUnlessEqual(l.get_metrics(), {'limit': 2, 'inflight': 0, 'requests': 66, 'drops': 2})
+
+    def test_latency_threshold(self):
+        l = AIMDLimiter(initial_limit=10, latency_threshold=1.0)
+        l.acquire()
+        l.release(2.0)
+        self.failUnlessEqual(l.limit, 9)
+
+    def test_bad_arguments(self):
+        self.failUnlessRaises(ValueError, AIMDLimiter, initial_limit=0)
+        self.failUnlessRaises(ValueError, AIMDLimiter, initial_limit=10, max_limit=5)
+        self.failUnlessRaises(ValueError, AIMDLimiter, backoff_ratio=1)
+
+    def test_client_reports_to_limiter(self):
+        l = AIMDLimiter(initial_limit=1)
+        c = Client('whatever', 'whatever', limiter=l)
+        c.http = mock.Mock()
+        c.http.request.return_value = ({'status': '404'}, '{}')
+        self.failUnlessRaises(APIError, c._request, 'http://thing', 'GET')
+        c.http.request.return_value = ({'status': '503'}, '{}')
+        self.failUnlessRaises(APIError, c._request, 'http://thing', 'GET')
+        c.http.request.side_effect = EnvironmentError('connection refused')
+        self.failUnlessRaises(EnvironmentError, c._request, 'http://thing', 'GET')
+        self.failUnlessEqual(l.get_metrics(), {'limit': 1, 'inflight': 0, 'requests': 3, 'drops': 2})
+
+class SaturationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer(latency=0.01, capacity=4).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_limit_adapts_to_saturated_server(self):
+        limiter = AIMDLimiter(initial_limit=16, max_limit=32, backoff_ratio=0.7)
+        errors = []
+        def work():
+            c = Client('whatever', 'whatever', host='127.0.0.1', port=self.server.port, limiter=limiter)
+            for i in range(15):
+                try:
+                    c.get_feature(HANDLE)
+                except APIError, e:
+                    errors.append(e.code)
+        threads = [threading.Thread(target=work) for i in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.failUnless(errors, "the server should have been saturated at first")
+        self.failUnlessEqual(set(errors), set([503]))
+        self.failUnless(limiter.limit < 16, limiter.get_metrics())
+        self.failUnlessEqual(limiter.inflight, 0)
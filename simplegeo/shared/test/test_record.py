@@ -1,6 +1,6 @@
 import unittest
-import re
-from simplegeo.shared import Feature, deep_swap
+import re, copy, pickle, cPickle
+from simplegeo.shared import Feature, deep_swap, simplify_line, make_quantizer, pack_coordinates, unpack_coordinates
 from decimal import Decimal as D
 
 class FeatureTest(unittest.TestCase):
@@ -225,3 +225,148 @@ class FeatureTest(unittest.TestCase):
         dic = rec.to_dict()
         self.failUnlessEqual(dic.get('id'), None)
         self.failUnlessEqual(dic.get('properties', {}).get('record_id'), None)
+
+class GeometryReductionTest(unittest.TestCase):
+
+    def test_simplify_line(self):
+        line = [(0.0, 0.0), (0.0001, 1.0), (0.0, 2.0), (1.0, 3.0)]
+        self.failUnlessEqual(simplify_line(line, 0.01), [(0.0, 0.0), (0.0, 2.0), (1.0, 3.0)])
+        self.failUnlessEqual(simplify_line(line, 0), line)
+        self.failUnlessEqual(simplify_line(line[:2], 10), line[:2])
+
+    def test_simplify_ring_stays_closed(self):
+        ring = [(0, 0), (0, 1), (D('0.00001'), 2), (0, 3), (1, 3), (1, 0), (0, 0)]
+        simplified = simplify_line(ring, 0.01)
+        self.failUnlessEqual(simplified, [(0, 0), (0, 3), (1, 3), (1, 0), (0, 0)])
+
+        # Would collapse below four points, so the most significant
+        # four are kept.
+        sliver = [(0, 0), (0.001, 1), (0, 2), (0, 0)]
+        self.failUnlessEqual(simplify_line(sliver, 1), sliver)
+        square = [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0), (0, 0)]
+        self.failUnlessEqual(simplify_line(square, 0.5), [(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)])
+        self.failUnlessEqual(simplify_line(square, 5), [(0, 0), (2, 2), (2, 0), (0, 0)])
+
+    def test_larger_tolerance_never_keeps_more(self):
+        square = [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0), (0, 0)]
+        line = [(0, 0), (0.2, 1), (0, 2), (0.5, 3), (0, 4), (1.5, 5)]
+        for points in (square, line):
+            lengths = [len(simplify_line(points, tolerance)) for tolerance in (0.01, 0.1, 0.5, 1, 2, 5, 100)]
+            self.failUnlessEqual(lengths, sorted(lengths, reverse=True), (points, lengths))
+
+    def test_make_quantizer(self):
+        q = make_quantizer(2)
+        self.failUnlessEqual(q(D('37.80163')), D('37.80'))
+        self.failUnless(isinstance(q(D('37.80163')), D))
+        self.failUnlessEqual(q(37.80663), 37.81)
+        self.failUnlessEqual(q(37), 37)
+
+        q = make_quantizer(3, decimal_to_float=True)
+        self.failUnlessEqual(q(D('37.80163')), 37.802)
+        self.failUnless(isinstance(q(D('37.80163')), float))
+
+        q = make_quantizer(decimal_to_float=True)
+        self.failUnlessEqual(q(D('37.80163')), 37.80163)
+
+        self.failUnlessRaises(TypeError, make_quantizer, -1)
+        self.failUnlessRaises(TypeError, make_quantizer, 1.5)
+        self.failUnlessRaises(TypeError, make_quantizer, 30)
+        self.failUnlessEqual(make_quantizer(2)(D('1e30')), D('1e30'))
+
+    def test_from_dict_reduces_polygon(self):
+        record_dict = {
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[[D('0.0'), D('0.0')], [D('1.0'), D('0.00001')], [D('2.0'), D('0.0')], [D('2.0'), D('2.0')], [D('0.0'), D('2.0')], [D('0.0'), D('0.0')]]],
+                },
+            'type': 'Feature',
+            'properties': {'record_id': 'my_id'},
+            }
+
+        record = Feature.from_dict(record_dict)
+        self.failUnlessEqual(len(record.coordinates[0]), 6)
+
+        record = Feature.from_dict(record_dict, simplify_tolerance=0.001, precision=1, decimal_to_float=True)
+        self.failUnlessEqual(record.coordinates, [[(0.0, 0.0), (0.0, 2.0), (2.0, 2.0), (2.0, 0.0), (0.0, 0.0)]])
+        self.failUnless(isinstance(record.coordinates[0][0][0], float))
+        self.failUnlessEqual(record.to_dict()['geometry']['coordinates'][0][1], (2.0, 0.0))
+
+    def test_from_json_quantizes_point(self):
+        jsonstr = '{"geometry": {"type": "Point", "coordinates": [-122.4783123, 37.8016456]}, "type": "Feature", "id": null, "properties": {}}'
+        record = Feature.from_json(jsonstr, precision=4, simplify_tolerance=1)
+        self.failUnlessEqual(record.coordinates, (D('37.8016'), D('-122.4783')))
+
+    def test_from_dict_out_of_range_with_precision(self):
+        record_dict = {'geometry': {'type': 'Point', 'coordinates': [D('1'), D('1e30')]}, 'type': 'Feature', 'properties': {}}
+        self.failUnlessRaises(TypeError, Feature.from_dict, record_dict, precision=2)
+        self.failUnlessRaises(TypeError, Feature.from_dict, record_dict, precision=2, decimal_to_float=True)
+
+    def test_multipoint_is_not_simplified(self):
+        record_dict = {
+            'geometry': {
+                'type': 'MultiPoint',
+                'coordinates': [[0.0, 0.0], [1.0, 0.0], [2.0, 0.0]],
+                },
+            'type': 'Feature',
+            'properties': {},
+            }
+        record = Feature.from_dict(record_dict, simplify_tolerance=1)
+        self.failUnlessEqual(len(record.coordinates), 3)
+
+class PickleTest(unittest.TestCase):
+
+    def roundtrip(self, coordinates):
+        packed = pack_coordinates(coordinates)
+        self.failIfEqual(packed, None)
+        unpacked = unpack_coordinates(packed)
+        self.failUnlessEqual(unpacked, coordinates)
+        self.failUnlessEqual(repr(unpacked), repr(coordinates))
+
+    def test_pack_coordinates(self):
+        self.roundtrip((37.8016, -122.4783))
+        self.roundtrip([37, -122])
+        self.roundtrip((D('37.8016'), D('-122.4783')))
+        self.roundtrip([(0.0, 0.0), (1.5, 2.5)])
+        self.roundtrip([[(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)], [(1, 1), (1, 2), (2, 1), (1, 1)]])
+        self.roundtrip([[[(D('1.0'), D('2E+1'))]], [[(D('-3.25'), D('4'))], [(D('5'), D('6')), (D('7'), D('8'))]]])
+        self.roundtrip([[1.0, 2.0], [3.0, 4.0]])
+
+    def test_unpackable_coordinates(self):
+        self.failUnlessEqual(pack_coordinates((37, -122.5)), None)
+        self.failUnlessEqual(pack_coordinates([(1, 2), [3, 4]]), None)
+        self.failUnlessEqual(pack_coordinates(((1, 2), (3, 4))), None)
+        self.failUnlessEqual(pack_coordinates([[(1, 2)], []]), None)
+        self.failUnlessEqual(pack_coordinates((True, False)), None)
+
+    def test_min_numbers(self):
+        ring = [(float(i), 0.0) for i in range(10)]
+        self.failUnlessEqual(pack_coordinates([ring], 21), None)
+        self.failIfEqual(pack_coordinates([ring], 20), None)
+        # Decimals are packed however few there are.
+        self.failIfEqual(pack_coordinates([[(D(1), D(2))]], 21), None)
+
+    def test_pickle_feature(self):
+        jsonstr = '{"geometry": {"type": "Polygon", "coordinates": [[[-122.1, 37.1], [-122.2, 37.1], [-122.2, 37.2], [-122.1, 37.1]]]}, "type": "Feature", "id": "SG_4bgzicKFmP89tQFGLGZYy0", "properties": {"name": "x", "record_id": "r1"}}'
+        f = Feature.from_json(jsonstr)
+        for dumps, loads in ((pickle.dumps, pickle.loads), (cPickle.dumps, cPickle.loads)):
+            for protocol in (0, 2):
+                f2 = loads(dumps(f, protocol))
+                self.failUnlessEqual(f2.to_json(), f.to_json())
+                self.failUnlessEqual(f2.coordinates, f.coordinates)
+                self.failUnlessEqual(f2.strict_lon_validation, f.strict_lon_validation)
+                self.failIf('packed_coordinates' in f2.__dict__)
+        self.failUnless('packed_coordinates' in f.__getstate__())
+        self.failUnless(len(cPickle.dumps(f, 2)) < len(cPickle.dumps(f.__dict__, 2)))
+
+        # Small geometries of floats aren't worth packing, large ones are.
+        f = Feature([[(float(i), 0.0) for i in range(10)]], geomtype='LineString')
+        self.failIf('packed_coordinates' in f.__getstate__())
+        f = Feature([[(i / 1000.0, 0.0) for i in range(1000)]], geomtype='LineString')
+        self.failUnless('packed_coordinates' in f.__getstate__())
+        self.failUnlessEqual(cPickle.loads(cPickle.dumps(f, 2)).coordinates, f.coordinates)
+
+        # Coordinates which can't be packed are pickled as they are.
+        f = Feature([(37, -122.5)], geomtype='MultiPoint')
+        f2 = cPickle.loads(cPickle.dumps(f, 2))
+        self.failUnlessEqual(f2.coordinates, [(37, -122.5)])
+        self.failUnlessEqual(copy.deepcopy(f).coordinates, [(37, -122.5)])
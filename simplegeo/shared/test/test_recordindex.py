@@ -0,0 +1,66 @@
+import unittest, os, tempfile, shutil
+from simplegeo.shared import Feature, RecordIndex
+from simplegeo.shared.recordindex import content_hash
+from decimal import Decimal as D
+
+HANDLE = 'SG_4bgzicKFmP89tQFGLGZYy0_34.714646_-86.584970'
+
+class RecordIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup(self):
+        index = RecordIndex()
+        f = Feature((D('37.8016'), D('-122.4783')), properties={'record_id': 'my_id', 'name': 'a'})
+        self.failUnlessEqual(index.lookup(f), None)
+        index.add(f, HANDLE)
+        self.failUnless('my_id' in index)
+        self.failUnlessEqual(index.lookup(f), HANDLE)
+
+        # The assigned id doesn't count as a change.
+        same = Feature((D('37.8016'), D('-122.4783')), simplegeohandle=HANDLE, properties={'name': 'a', 'record_id': 'my_id'})
+        self.failUnlessEqual(index.lookup(same), HANDLE)
+
+        changed = Feature((D('37.8016'), D('-122.4783')), properties={'record_id': 'my_id', 'name': 'b'})
+        self.failUnlessEqual(index.lookup(changed), None)
+
+        moved = Feature((D('37.8017'), D('-122.4783')), properties={'record_id': 'my_id', 'name': 'a'})
+        self.failUnlessEqual(index.lookup(moved), None)
+
+        self.failUnlessEqual(index.lookup_hash('my_id', content_hash(same)), HANDLE)
+        index.add_hash('my_id', content_hash(changed), HANDLE)
+        self.failUnlessEqual(index.lookup(changed), HANDLE)
+        self.failUnlessEqual(index.lookup(f), None)
+
+        index.discard('my_id')
+        self.failUnlessEqual(len(index), 0)
+
+    def test_no_record_id(self):
+        index = RecordIndex()
+        f = Feature((D('37.8016'), D('-122.4783')))
+        self.failUnlessEqual(index.lookup(f), None)
+        self.failUnlessRaises(ValueError, index.add, f, HANDLE)
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmpdir, 'index')
+        self.failUnlessEqual(len(RecordIndex.load(path)), 0)
+
+        index = RecordIndex()
+        features = [Feature((D('37.8016'), D(i)), properties={'record_id': u'id \u2764 %d' % i}) for i in range(100)]
+        for i, f in enumerate(features):
+            index.add(f, HANDLE[:25] + '_%d' % i)
+        index.save(path)
+
+        loaded = RecordIndex.load(path)
+        self.failUnlessEqual(len(loaded), 100)
+        for i, f in enumerate(features):
+            self.failUnlessEqual(loaded.lookup(f), HANDLE[:25] + '_%d' % i)
+
+        open(path, 'wb').write(open(path, 'rb').read()[:-3])
+        self.failUnlessRaises(ValueError, RecordIndex.load, path)
+        open(path, 'wb').write('garbage')
+        self.failUnlessRaises(ValueError, RecordIndex.load, path)
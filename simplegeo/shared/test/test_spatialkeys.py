@@ -0,0 +1,92 @@
+import unittest
+from simplegeo.shared import Feature, SpatialKeyIndex, sort_by_spatial_key, partition_by_spatial_key
+from simplegeo.shared.spatialkeys import geohash, quadkey, hilbert_key, normalize_lon
+
+class SpatialKeyTest(unittest.TestCase):
+
+    def test_geohash(self):
+        self.failUnlessEqual(geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.failUnlessEqual(geohash(-90, -180, 3), '000')
+
+    def test_quadkey(self):
+        self.failUnlessEqual(quadkey(45, -90, 1), '0')
+        self.failUnlessEqual(quadkey(45, 90, 1), '1')
+        self.failUnlessEqual(quadkey(-45, -90, 1), '2')
+        self.failUnlessEqual(quadkey(-45, 90, 1), '3')
+        self.failUnless(quadkey(37.8016, -122.4783, 10).startswith(quadkey(37.8016, -122.4783, 3)))
+        # Latitudes beyond Web Mercator are clipped, not an error.
+        self.failUnlessEqual(quadkey(90, 0, 2), '10')
+        self.failUnlessRaises(ValueError, quadkey, 0, 0, 0)
+
+    def test_hilbert_key(self):
+        self.failUnlessEqual(hilbert_key(-45, -90, 1), 0)
+        self.failUnlessEqual(hilbert_key(45, -90, 1), 1)
+        self.failUnlessEqual(hilbert_key(45, 90, 1), 2)
+        self.failUnlessEqual(hilbert_key(-45, 90, 1), 3)
+        self.failUnless(0 <= hilbert_key(90, 180) < 4**16)
+
+    def test_wrapped_lon(self):
+        self.failUnlessEqual(normalize_lon(190), -170)
+        self.failUnlessEqual(normalize_lon(-190), 170)
+        self.failUnlessEqual(normalize_lon(180), -180)
+        self.failUnlessEqual(geohash(10, 190), geohash(10, -170))
+        self.failUnlessEqual(quadkey(10, 190), quadkey(10, -170))
+        self.failUnlessEqual(hilbert_key(10, 190), hilbert_key(10, -170))
+
+class FeatureSpatialKeyTest(unittest.TestCase):
+
+    def test_point(self):
+        f = Feature((57.64911, 10.40744))
+        self.failUnlessEqual(f.representative_point(), (57.64911, 10.40744))
+        self.failUnlessEqual(f.geohash(11), 'u4pruydqqvj')
+        self.failUnlessEqual(f.quadkey(5), quadkey(57.64911, 10.40744, 5))
+        self.failUnlessEqual(f.hilbert_key(), hilbert_key(57.64911, 10.40744))
+
+    def test_polygon(self):
+        f = Feature([[(10, 20), (10, 30), (20, 30), (20, 20), (10, 20)]], geomtype='Polygon')
+        self.failUnlessEqual(f.representative_point(), (15, 25))
+
+    def test_polygon_across_antimeridian(self):
+        f = Feature([[(10, 170), (10, 190), (20, 190), (20, 170), (10, 170)]], geomtype='Polygon')
+        self.failUnlessEqual(f.representative_point(), (15, -180))
+
+class SpatialKeyIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        # Two clusters, interleaved.
+        self.features = []
+        for i in range(10):
+            self.features.append(Feature((37.80 + i * 0.001, -122.47)))
+            self.features.append(Feature((-33.86 + i * 0.001, 151.20)))
+
+    def test_sort(self):
+        for key in ('geohash', 'quadkey', 'hilbert'):
+            ordered = sort_by_spatial_key(self.features, key)
+            self.failUnlessEqual(len(ordered), 20)
+            self.failUnlessEqual(set(map(id, ordered)), set(map(id, self.features)))
+            lats = [f.coordinates[0] > 0 for f in ordered]
+            # Each cluster is contiguous.
+            self.failUnless(lats in ([True]*10 + [False]*10, [False]*10 + [True]*10), (key, lats))
+        self.failUnlessRaises(ValueError, sort_by_spatial_key, self.features, 'zorder')
+
+    def test_partition(self):
+        parts = partition_by_spatial_key(self.features, 2, 'geohash', precision=6)
+        self.failUnlessEqual([len(p) for p in parts], [10, 10])
+        for p in parts:
+            self.failUnlessEqual(len(set(f.coordinates[0] > 0 for f in p)), 1)
+        parts = partition_by_spatial_key(self.features, 3)
+        self.failUnlessEqual([len(p) for p in parts], [7, 7, 6])
+        self.failUnlessRaises(ValueError, partition_by_spatial_key, self.features, 0)
+
+    def test_range_and_prefix(self):
+        index = SpatialKeyIndex(self.features, 'geohash', precision=8)
+        self.failUnlessEqual(len(index), 20)
+        sf = index.prefix(geohash(37.8016, -122.4783, 3))
+        self.failUnlessEqual(len(sf), 10)
+        self.failUnless(all(f.coordinates[0] > 0 for f in sf))
+        self.failUnlessEqual(index.range(index.keys[0], index.keys[4]), index.features[:5])
+        self.failUnlessEqual(index.prefix('zzz'), [])
+
+        index = SpatialKeyIndex(self.features)
+        self.failUnlessEqual(index.range(0, 4**16), index.features)
+        self.failUnlessRaises(ValueError, index.prefix, '0')